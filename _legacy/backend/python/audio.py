@@ -0,0 +1,244 @@
+"""Audio container helpers shared by the synthesis endpoints."""
+import struct
+import tempfile
+from typing import IO, Iterator, Optional, Tuple
+
+from config import AUDIO_SPOOL_MAX_MEMORY_BYTES
+
+# Content types for each supported output format
+MEDIA_TYPES = {
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "ogg": "audio/ogg",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+    "pcm": "audio/L16",
+}
+
+# RIFF/data size used for WAV streams whose total length is not yet known
+_STREAMING_SIZE = 0xFFFFFFFF
+
+# MPEG audio Layer III bitrates (kbit/s) by bitrate index, for MPEG-1 and MPEG-2/2.5
+_MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# Sample rates by MPEG version bits (0 = 2.5, 2 = 2, 3 = 1) and sample-rate index
+_MP3_SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+
+def spooled_buffer() -> IO[bytes]:
+    """Return a buffer for collecting upstream audio that moves to a temporary file when large."""
+    return tempfile.SpooledTemporaryFile(max_size=AUDIO_SPOOL_MAX_MEMORY_BYTES)
+
+
+def read_spooled(buffer: IO[bytes]) -> bytes:
+    """Return everything written to a spooled buffer as one bytes object.
+
+    Reading a known size back allocates the result once, so collecting a clip
+    peaks at about its own size rather than the two to three copies left by
+    growing and then freezing a bytearray.
+    """
+    size = buffer.tell()
+    buffer.seek(0)
+    return buffer.read(size)
+
+
+def media_type(audio_format: str) -> str:
+    """Return the HTTP content type for an audio format."""
+    return MEDIA_TYPES.get(audio_format, "application/octet-stream")
+
+
+def split_wav(data: bytes) -> Tuple[bytes, bytes]:
+    """Split a RIFF/WAVE file into its header (up to the data chunk) and raw sample data."""
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE file")
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", data, offset)
+        if chunk_id == b"data":
+            start = offset + 8
+            return data[:start], data[start:start + chunk_size]
+        # Chunks are padded to an even number of bytes
+        offset += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV file has no data chunk")
+
+
+def streaming_wav_header(header: bytes) -> bytes:
+    """Rewrite a WAV header's RIFF and data sizes to the 'unknown length' streaming marker."""
+    patched = bytearray(header)
+    struct.pack_into("<I", patched, 4, _STREAMING_SIZE)
+    struct.pack_into("<I", patched, len(patched) - 4, _STREAMING_SIZE)
+    return bytes(patched)
+
+
+def build_wav(header: bytes, samples: bytes) -> bytes:
+    """Rewrite a WAV header's RIFF and data sizes to match the given sample data."""
+    patched = bytearray(header)
+    struct.pack_into("<I", patched, 4, len(patched) - 8 + len(samples))
+    struct.pack_into("<I", patched, len(patched) - 4, len(samples))
+    return bytes(patched) + samples
+
+
+def _id3v2_size(data: bytes) -> int:
+    """Return the length of a leading ID3v2 tag, or 0 if there is none."""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    # Bit 4 of the flags byte signals a 10-byte footer
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+
+def mp3_frames(data: bytes) -> Iterator[Tuple[int, int, int, int]]:
+    """Yield (offset, length, samples, sample_rate) for each MPEG Layer III frame."""
+    offset = _id3v2_size(data)
+    while offset + 4 <= len(data):
+        b1, b2 = data[offset + 1], data[offset + 2]
+        if data[offset] != 0xFF or b1 & 0xE0 != 0xE0:
+            # Trailing ID3v1 tag or junk: stop at the last complete frame
+            break
+        version = (b1 >> 3) & 0x03
+        layer = (b1 >> 1) & 0x03
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 0x03
+        if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+            break
+        mpeg1 = version == 3
+        bitrate = _MP3_BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+        sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+        padding = (b2 >> 1) & 0x01
+        length = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+        if offset + length > len(data):
+            break
+        yield offset, length, 1152 if mpeg1 else 576, sample_rate
+        offset += length
+
+
+def _wav_layout(data: bytes) -> Optional[Tuple[int, int, int, int]]:
+    """Return (data offset, data size, byte rate, block align) of a WAV file, or None."""
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    byte_rate = block_align = 0
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", data, offset)
+        if chunk_id == b"fmt " and offset + 24 <= len(data):
+            byte_rate, block_align = struct.unpack_from("<IH", data, offset + 16)
+        elif chunk_id == b"data":
+            start = offset + 8
+            # Streamed WAV headers carry a placeholder size; trust the bytes present
+            return (start, min(chunk_size, len(data) - start), byte_rate, block_align) if byte_rate else None
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def seek_index(data: bytes, audio_format: str, interval_ms: int = 1000) -> Optional[Tuple[int, list[Tuple[int, int]]]]:
+    """Return (duration_ms, [(time_ms, byte_offset), ...]) with a point about every interval_ms.
+
+    MP3 offsets are frame boundaries, so decoding can start there; WAV offsets are
+    block-aligned positions in the data chunk (the header is at offset 0). Returns
+    None for other formats or audio that does not parse.
+    """
+    if audio_format == "wav":
+        layout = _wav_layout(data)
+        if layout is None:
+            return None
+        start, size, byte_rate, block_align = layout
+        step = max(block_align, byte_rate * interval_ms // 1000 // max(block_align, 1) * max(block_align, 1))
+        points = [(offset * 1000 // byte_rate, start + offset) for offset in range(0, size, step)]
+        return size * 1000 // byte_rate, points
+    if audio_format == "mp3":
+        points = []
+        samples = 0
+        sample_rate = 0
+        for offset, length, frame_samples, sample_rate in mp3_frames(data):
+            if not points and samples == 0 and _is_mp3_info_frame(data[offset:offset + length]):
+                continue
+            time_ms = samples * 1000 // sample_rate
+            if not points or time_ms >= points[-1][0] + interval_ms:
+                points.append((time_ms, offset))
+            samples += frame_samples
+        if not points:
+            return None
+        return samples * 1000 // sample_rate, points
+    return None
+
+
+def audio_duration_ms(data: bytes, audio_format: str) -> Optional[int]:
+    """Return the playing time of WAV or MP3 audio from its headers and frames, or None."""
+    if audio_format == "wav":
+        layout = _wav_layout(data)
+        return layout[1] * 1000 // layout[2] if layout is not None else None
+    index = seek_index(data, audio_format, interval_ms=1 << 30)
+    return index[0] if index is not None else None
+
+
+def _is_mp3_info_frame(frame: bytes) -> bool:
+    """Return True for a Xing/Info/VBRI header frame, which holds no audio."""
+    head = frame[:64]
+    return b"Xing" in head or b"Info" in head or b"VBRI" in head
+
+
+def _mp3_audio_frames(data: bytes) -> bytes:
+    """Return only the audio frames of an MP3 file, without tags or info frames."""
+    frames = []
+    for offset, length, _, _ in mp3_frames(data):
+        frame = data[offset:offset + length]
+        if not frames and _is_mp3_info_frame(frame):
+            continue
+        frames.append(frame)
+    # Leave data that does not parse as MPEG audio untouched rather than dropping it
+    return b"".join(frames) if frames else data
+
+
+def _flac_join(parts: list[bytes]) -> bytes:
+    """Join FLAC files by keeping the first stream header and appending every part's frames."""
+    bodies = []
+    header = b""
+    for i, part in enumerate(parts):
+        if part[:4] != b"fLaC":
+            raise ValueError("Not a FLAC file")
+        offset = 4
+        while True:
+            block_header = part[offset]
+            length = int.from_bytes(part[offset + 1:offset + 4], "big")
+            offset += 4 + length
+            if block_header & 0x80:
+                break
+        if i == 0:
+            header = bytearray(part[:offset])
+            # STREAMINFO: mark min/max frame size, total samples and MD5 as unknown
+            streaminfo = 8
+            header[streaminfo + 4:streaminfo + 10] = bytes(6)
+            header[streaminfo + 13] &= 0xF0
+            header[streaminfo + 14:streaminfo + 34] = bytes(20)
+        bodies.append(part[offset:])
+    return bytes(header) + b"".join(bodies)
+
+
+def concat_audio(parts: list[bytes], audio_format: str) -> bytes:
+    """Join separately rendered clips of the same format into one file.
+    
+    MP3 is joined at the frame level, dropping tags and Xing/Info frames. WAV data
+    chunks are merged under the first clip's header. FLAC keeps the first stream
+    header, but frame numbers restart in each clip, so strict decoders may stop
+    after the first one. Ogg clips are chained, which is a valid physical Ogg
+    bitstream; ADTS AAC and raw PCM are self-delimiting and are concatenated as-is.
+    Prefer joining WAV and encoding once when a transcoder is available.
+    """
+    if len(parts) == 1:
+        return parts[0]
+    if audio_format == "mp3":
+        return b"".join(_mp3_audio_frames(part) for part in parts)
+    if audio_format == "wav":
+        header, _ = split_wav(parts[0])
+        return build_wav(header, b"".join(split_wav(part)[1] for part in parts))
+    if audio_format == "flac":
+        return _flac_join(parts)
+    return b"".join(parts)
@@ -0,0 +1,178 @@
+"""Offline stand-ins for the Gemini (Cloud Text-to-Speech) and OpenAI speech APIs.
+
+Serves the endpoints the backend calls, with configurable latency distributions,
+chunked streaming and error injection, plus an OAuth token endpoint so that the
+real service-account flow in services/credentials.py works without network access.
+
+Point the backend at it with:
+    GEMINI_API_URL=http://127.0.0.1:9100/v1/text:synthesize
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+    GOOGLE_APPLICATION_CREDENTIALS=<file from write_service_account()>
+
+Usage:
+    python benchmarks/fake_providers.py --port 9100
+    python benchmarks/fake_providers.py --gemini-latency lognormal:600,0.4 --error-rate 0.02 --error-status 429,503
+
+Latency specs are in milliseconds: "fixed:MS", "uniform:LO,HI" or "lognormal:MEDIAN,SIGMA".
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import random
+import struct
+from collections import Counter
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# Speaking rate used to size the fake audio, and the size of compressed audio per second
+CHARS_PER_SECOND = 15
+COMPRESSED_BYTES_PER_SECOND = 8000
+SAMPLE_RATE = 24000
+
+ACCESS_TOKEN = "offline-benchmark-token"
+
+
+class Latency:
+    """A latency distribution parsed from a spec string; samples are in seconds."""
+
+    def __init__(self, spec: str):
+        kind, _, args = spec.partition(":")
+        values = [float(v) for v in args.split(",") if v]
+        if kind == "fixed" and len(values) == 1:
+            self._sample = lambda: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self._sample = lambda: random.uniform(values[0], values[1])
+        elif kind == "lognormal" and len(values) == 2:
+            self._sample = lambda: random.lognormvariate(math.log(values[0]), values[1])
+        else:
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+        self.spec = spec
+
+    def sample(self) -> float:
+        return max(0.0, self._sample()) / 1000
+
+
+def _wav(pcm_bytes: int) -> bytes:
+    header = b"RIFF" + struct.pack("<I", 36 + pcm_bytes) + b"WAVEfmt "
+    header += struct.pack("<IHHIIHH", 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16)
+    return header + b"data" + struct.pack("<I", pcm_bytes) + bytes(pcm_bytes)
+
+
+def fake_audio(audio_format: str, chars: int) -> bytes:
+    """Return audio-sized filler for `chars` characters of speech."""
+    seconds = max(1, chars) / CHARS_PER_SECOND
+    if audio_format in ("wav", "LINEAR16"):
+        return _wav(int(seconds * SAMPLE_RATE) * 2)
+    if audio_format == "pcm":
+        return bytes(int(seconds * SAMPLE_RATE) * 2)
+    return b"\xff\xf3" * int(seconds * COMPRESSED_BYTES_PER_SECOND / 2)
+
+
+def write_service_account(path: Path, token_uri: str) -> Path:
+    """Write a throwaway service-account key whose token endpoint is the fake server."""
+    import rsa  # installed with google-auth
+
+    _, private_key = rsa.newkeys(1024)
+    path.write_text(json.dumps({
+        "type": "service_account",
+        "project_id": "offline-benchmark",
+        "private_key_id": "offline",
+        "private_key": private_key.save_pkcs1().decode("ascii"),
+        "client_email": "benchmark@offline-benchmark.iam.gserviceaccount.com",
+        "client_id": "0",
+        "token_uri": token_uri,
+    }))
+    return path
+
+
+def create_app(gemini_latency: Latency, openai_latency: Latency, chunk_bytes: int = 4096,
+               chunk_interval: float = 0.02, error_rate: float = 0.0,
+               error_statuses: tuple[int, ...] = (503,)) -> FastAPI:
+    """Build the stand-in app; latencies delay the response headers, chunks pace the OpenAI body."""
+    app = FastAPI()
+    requests: Counter = Counter()
+
+    def injected_error(provider: str):
+        if random.random() >= error_rate:
+            return None
+        status = random.choice(error_statuses)
+        requests[f"{provider}_errors"] += 1
+        headers = {"Retry-After": "1"} if status == 429 else None
+        body = {"error": {"code": status, "message": "injected by fake_providers", "type": "server_error"}}
+        return JSONResponse(body, status_code=status, headers=headers)
+
+    @app.post("/token")
+    async def token():
+        requests["token"] += 1
+        return {"access_token": ACCESS_TOKEN, "expires_in": 3600, "token_type": "Bearer"}
+
+    @app.post("/v1/text:synthesize")
+    async def gemini(request: Request):
+        requests["gemini"] += 1
+        body = await request.json()
+        await asyncio.sleep(gemini_latency.sample())
+        error = injected_error("gemini")
+        if error is not None:
+            return error
+        audio = fake_audio(body["audioConfig"]["audioEncoding"], len(body["input"]["text"]))
+        return {"audioContent": base64.b64encode(audio).decode("ascii")}
+
+    @app.post("/v1/audio/speech")
+    async def openai(request: Request):
+        requests["openai"] += 1
+        body = await request.json()
+        await asyncio.sleep(openai_latency.sample())
+        error = injected_error("openai")
+        if error is not None:
+            return error
+        audio = fake_audio(body.get("response_format", "mp3"), len(body["input"]))
+
+        async def chunks():
+            for offset in range(0, len(audio), chunk_bytes):
+                if offset:
+                    await asyncio.sleep(chunk_interval)
+                yield audio[offset:offset + chunk_bytes]
+
+        return StreamingResponse(chunks(), media_type="application/octet-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return dict(requests)
+
+    @app.get("/health")
+    async def health():
+        return Response(status_code=204)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--gemini-latency", default="lognormal:500,0.3", help="Gemini response latency (ms)")
+    parser.add_argument("--openai-latency", default="lognormal:300,0.3", help="OpenAI time to first byte (ms)")
+    parser.add_argument("--chunk-bytes", type=int, default=4096, help="OpenAI streaming chunk size")
+    parser.add_argument("--chunk-interval", type=float, default=20.0, help="Delay between OpenAI chunks (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", default="503", help="Comma-separated statuses to inject")
+    args = parser.parse_args()
+
+    app = create_app(
+        Latency(args.gemini_latency),
+        Latency(args.openai_latency),
+        chunk_bytes=args.chunk_bytes,
+        chunk_interval=args.chunk_interval / 1000,
+        error_rate=args.error_rate,
+        error_statuses=tuple(int(s) for s in args.error_status.split(",")),
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""Load benchmark: drive the server against offline stand-in providers.
+
+Starts benchmarks/fake_providers.py and the server under uvicorn, then runs a
+closed-loop load generator at each concurrency level and reports latency
+percentiles, requests/sec, status codes and the peak RSS of every worker.
+
+Usage:
+    python benchmarks/load.py                                   # openai synthesize at 1, 8, 32
+    python benchmarks/load.py --service gemini --endpoint stream --concurrency 4,16 --duration 20
+    python benchmarks/load.py --workers 4 --error-rate 0.02 --json out.json
+    python benchmarks/load.py --repeat --env CACHE_ENABLED=true # identical texts: cache and coalescing
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from fake_providers import write_service_account  # noqa: E402
+from startup import BACKEND_DIR, _free_port  # noqa: E402
+
+ENDPOINTS = {
+    "synthesize": "/api/v1/tts/synthesize",
+    "raw": "/api/v1/tts/synthesize?raw=true",
+    "stream": "/api/v1/tts/stream",
+    "document": "/api/v1/tts/document",
+}
+
+SENTENCE = "The quick brown fox jumps over the lazy dog near the quiet river bank. "
+
+
+def percentile(ordered: list[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def _children(pid: int) -> list[int]:
+    """Return the direct child processes of pid (Linux /proc)."""
+    children = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # The parent pid follows the parenthesised command name, which may contain spaces
+        if int(stat.rpartition(")")[2].split()[1]) == pid:
+            children.append(int(entry.name))
+    return children
+
+
+def worker_rss(pid: int) -> list[dict]:
+    """Return current and peak RSS (MB) of each uvicorn worker, or [] where /proc is unavailable."""
+    if not Path("/proc").exists():
+        return []
+    # With --workers > 1 the requests are served by spawned children of the supervisor
+    pids = [child for child in _children(pid)
+            if b"spawn_main" in (Path("/proc") / str(child) / "cmdline").read_bytes()]
+    workers = []
+    for worker in pids or [pid]:
+        fields = {}
+        try:
+            for line in (Path("/proc") / str(worker) / "status").read_text().splitlines():
+                key, _, value = line.partition(":")
+                fields[key] = value.strip()
+        except OSError:
+            continue
+        workers.append({
+            "pid": worker,
+            "rss_mb": int(fields.get("VmRSS", "0 kB").split()[0]) / 1024,
+            "peak_rss_mb": int(fields.get("VmHWM", "0 kB").split()[0]) / 1024,
+        })
+    return workers
+
+
+def _wait_until_up(url: str, proc: subprocess.Popen, name: str, timeout: float = 30.0) -> None:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{name} exited with status {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            time.sleep(0.05)
+    raise TimeoutError(f"{url} did not answer in time")
+
+
+def _payload(args, n: int) -> dict:
+    text = (SENTENCE * (args.text_chars // len(SENTENCE) + 1))[:args.text_chars]
+    if not args.repeat:
+        # A unique prefix keeps every request a cache miss
+        text = f"Request {n}. {text}"
+    return {"text": text, "service": args.service, "audio_format": args.audio_format}
+
+
+async def _one(client: httpx.AsyncClient, path: str, payload: dict) -> tuple[int, float, float]:
+    """Send one request and return (status, seconds to first body byte, seconds to completion)."""
+    start = time.perf_counter()
+    first = None
+    try:
+        async with client.stream("POST", path, json=payload) as response:
+            async for _ in response.aiter_raw():
+                if first is None:
+                    first = time.perf_counter() - start
+            status = response.status_code
+    except httpx.HTTPError:
+        status = 0
+    total = time.perf_counter() - start
+    return status, first if first is not None else total, total
+
+
+async def run_level(args, base_url: str, concurrency: int, counter: list[int]) -> dict:
+    """Keep `concurrency` requests in flight for the configured duration and summarize them."""
+    path = ENDPOINTS[args.endpoint]
+    latencies: list[float] = []
+    ttfb: list[float] = []
+    statuses: Counter = Counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        deadline = time.perf_counter() + args.duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                counter[0] += 1
+                status, first, total = await _one(client, path, _payload(args, counter[0]))
+                statuses[status] += 1
+                if status == 200:
+                    latencies.append(total)
+                    ttfb.append(first)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    ttfb.sort()
+    completed = sum(statuses.values())
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return value * 1000 if value is not None else None
+
+    return {
+        "concurrency": concurrency,
+        "requests": completed,
+        "errors": completed - statuses[200],
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "requests_per_second": completed / elapsed,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.50)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "mean": ms(statistics.fmean(latencies)) if latencies else None,
+            "max": ms(latencies[-1]) if latencies else None,
+        },
+        "ttfb_ms": {"p50": ms(percentile(ttfb, 0.50)), "p95": ms(percentile(ttfb, 0.95))},
+    }
+
+
+def _git_commit() -> Optional[str]:
+    proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True)
+    return proc.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service", default="openai", choices=["gemini", "openai", "auto"])
+    parser.add_argument("--endpoint", default="synthesize", choices=sorted(ENDPOINTS))
+    parser.add_argument("--audio-format", default="mp3")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of unmeasured load first")
+    parser.add_argument("--text-chars", type=int, default=200, help="Characters of text per request")
+    parser.add_argument("--repeat", action="store_true", help="Send identical texts instead of unique ones")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout (s)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra server configuration, e.g. CACHE_ENABLED=true")
+    parser.add_argument("--gemini-latency", default="lognormal:500,0.3")
+    parser.add_argument("--openai-latency", default="lognormal:300,0.3")
+    parser.add_argument("--chunk-interval", type=float, default=20.0, help="OpenAI chunk pacing (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", default="503")
+    parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    fake_port, server_port = _free_port(), _free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    base_url = f"http://127.0.0.1:{server_port}"
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        key_path = write_service_account(Path(tmp) / "service-account.json", f"{fake_url}/token")
+        env = {
+            **os.environ,
+            "GEMINI_API_URL": f"{fake_url}/v1/text:synthesize",
+            "OPENAI_BASE_URL": f"{fake_url}/v1",
+            "OPENAI_API_KEY": "offline-benchmark",
+            "GOOGLE_APPLICATION_CREDENTIALS": str(key_path),
+            # Measure the serving path, not the client-side safeguards, unless asked to
+            "CACHE_ENABLED": "false",
+            "GEMINI_REQUESTS_PER_SECOND": "0",
+            "OPENAI_REQUESTS_PER_SECOND": "0",
+            "WARMUP_PROVIDERS": "gemini,openai",
+            # Keep caches, stored audio, profiles and shared limiter state out of the working tree
+            "CACHE_DIR": str(Path(tmp) / "cache"),
+            "AUDIO_STORE_DIR": str(Path(tmp) / "objects"),
+            "PROFILE_DIR": str(Path(tmp) / "profiles"),
+            "SHARED_STATE_PATH": str(Path(tmp) / "state.db"),
+        }
+        env.update(item.split("=", 1) for item in args.env)
+
+        fake_command = [
+            sys.executable, str(Path(__file__).with_name("fake_providers.py")),
+            "--port", str(fake_port),
+            "--gemini-latency", args.gemini_latency,
+            "--openai-latency", args.openai_latency,
+            "--chunk-interval", str(args.chunk_interval),
+            "--error-rate", str(args.error_rate),
+            "--error-status", args.error_status,
+        ]
+        server_command = [
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(server_port),
+            "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+        ]
+        fake = subprocess.Popen(fake_command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        server = subprocess.Popen(
+            server_command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_until_up(f"{fake_url}/health", fake, Path(fake_command[1]).name)
+            _wait_until_up(f"{base_url}/health", server, server_command[2])
+            counter = [0]
+            if args.warmup > 0:
+                asyncio.run(run_level(argparse.Namespace(**{**vars(args), "duration": args.warmup}),
+                                      base_url, max(levels), counter))
+            results = []
+            for level in levels:
+                result = asyncio.run(run_level(args, base_url, level, counter))
+                result["workers"] = worker_rss(server.pid)
+                results.append(result)
+                lat = result["latency_ms"]
+                peak = max((w["peak_rss_mb"] for w in result["workers"]), default=0.0)
+                print(
+                    f"c={level:<4} {result['requests_per_second']:8.1f} req/s  "
+                    f"p50 {lat['p50'] or 0:7.1f}  p95 {lat['p95'] or 0:7.1f}  p99 {lat['p99'] or 0:7.1f} ms  "
+                    f"errors {result['errors']:<5} peak RSS/worker {peak:6.1f} MB"
+                )
+            upstream_calls = httpx.get(f"{fake_url}/stats").json()
+        finally:
+            server.terminate()
+            fake.terminate()
+            server.wait()
+            fake.wait()
+
+    report = {
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "options": {k: v for k, v in vars(args).items() if k != "json_path"},
+        "upstream_calls": upstream_calls,
+        "levels": results,
+    }
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
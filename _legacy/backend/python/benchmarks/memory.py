@@ -0,0 +1,167 @@
+"""Per-request peak memory benchmark: the buffered path vs the bounded-memory path.
+
+Starts benchmarks/fake_providers.py and, for WAV clips of several lengths, traces
+the peak Python memory of one request from the upstream call to the last byte of
+a JSON response:
+    before      growing bytearray (OpenAI) or resp.json() + b64decode (Gemini),
+                then base64 + dumps_json of the whole envelope (the old path)
+    after       the providers' spooled collection and streamed base64 decoding,
+                then main._respond, which streams large JSON envelopes
+
+Peaks are reported in MB and as a multiple of the clip size.
+
+Usage:
+    python benchmarks/memory.py                 # human-readable report
+    python benchmarks/memory.py --json out.json # also write machine-readable results
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fake_providers import CHARS_PER_SECOND, write_service_account  # noqa: E402
+from startup import _free_port  # noqa: E402
+
+SENTENCE = "The quick brown fox jumps over the lazy dog near the quiet river bank. "
+
+
+async def _consume(response) -> int:
+    """Drain a response body the way the server would send it and return its size."""
+    if hasattr(response, "body_iterator"):
+        size = 0
+        async for chunk in response.body_iterator:
+            size += len(chunk)
+        return size
+    return len(response.body)
+
+
+async def _before_gemini(gemini, text: str) -> dict:
+    token = await gemini._get_access_token()
+    payload = {
+        "input": {"text": text},
+        "voice": {"languageCode": "en-US", "name": "Kore", "modelName": "gemini-2.5-flash-tts"},
+        "audioConfig": {"audioEncoding": "LINEAR16"},
+    }
+    resp = await gemini._get_client().post(gemini.API_URL, json=payload, headers={"Authorization": f"Bearer {token}"})
+    return {"audio_bytes": base64.b64decode(resp.json()["audioContent"]), "audio_format": "wav", "duration_ms": 0}
+
+
+async def _before_openai(openai, text: str) -> dict:
+    chunks = await openai.stream(text, audio_format="wav")
+    audio_bytes = bytearray()
+    async for chunk in chunks:
+        audio_bytes += chunk
+    return {"audio_bytes": bytes(audio_bytes), "audio_format": "wav", "duration_ms": 0}
+
+
+async def measure(render, respond, text: str) -> dict:
+    """Trace one request and return its peak memory above the starting point."""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = await render(text)
+    body_bytes = await _consume(respond(result))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return {"peak_mb": peak / 1e6, "audio_bytes": len(result["audio_bytes"]), "body_bytes": body_bytes,
+            "ms": elapsed * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", default="10,60,300", help="Comma-separated clip lengths in seconds")
+    parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    fake_port = _free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        key_path = write_service_account(Path(tmp) / "service-account.json", f"{fake_url}/token")
+        os.environ.update({
+            "GEMINI_API_URL": f"{fake_url}/v1/text:synthesize",
+            "OPENAI_BASE_URL": f"{fake_url}/v1",
+            "OPENAI_API_KEY": "offline-benchmark",
+            "GOOGLE_APPLICATION_CREDENTIALS": str(key_path),
+            "CACHE_ENABLED": "false",
+            "GEMINI_REQUESTS_PER_SECOND": "0",
+            "OPENAI_REQUESTS_PER_SECOND": "0",
+        })
+        fake = subprocess.Popen(
+            [sys.executable, str(Path(__file__).with_name("fake_providers.py")), "--port", str(fake_port),
+             "--gemini-latency", "fixed:0", "--openai-latency", "fixed:0", "--chunk-interval", "0"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            results = asyncio.run(_run(args, fake_url))
+        finally:
+            fake.terminate()
+            fake.wait()
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+
+
+async def _run(args, fake_url: str) -> dict:
+    import main as server
+    import serialization
+    from services import gemini, openai
+
+    for _ in range(100):
+        try:
+            httpx.get(f"{fake_url}/health")
+            break
+        except httpx.HTTPError:
+            await asyncio.sleep(0.1)
+
+    def before_respond(result: dict):
+        payload = server._envelope(result, "bench")
+        return server.Response(serialization.dumps_json(payload), media_type=serialization.JSON)
+
+    def after_respond(result: dict):
+        return server._respond(result, {}, "bench", serialization.JSON)
+
+    paths = {
+        "gemini": {"before": lambda text: _before_gemini(gemini, text),
+                   "after": lambda text: gemini.render(text, audio_format="wav")},
+        "openai": {"before": lambda text: _before_openai(openai, text),
+                   "after": lambda text: openai.render(text, audio_format="wav")},
+    }
+    responders = {"before": before_respond, "after": after_respond}
+
+    # Warm up connections and the access token outside the measurements
+    for service in paths.values():
+        await service["after"]("Warm up.")
+
+    results = {"python": sys.version.split()[0], "cases": []}
+    for seconds in (int(s) for s in args.seconds.split(",")):
+        chars = seconds * CHARS_PER_SECOND
+        text = (SENTENCE * (chars // len(SENTENCE) + 1))[:chars]
+        for service, renders in paths.items():
+            case = {"service": service, "seconds": seconds}
+            for name, render in renders.items():
+                case[name] = await measure(render, responders[name], text)
+            results["cases"].append(case)
+
+            audio_mb = case["after"]["audio_bytes"] / 1e6
+            print(f"{service:<6} {seconds:>4}s ({audio_mb:5.1f} MB audio)  " + "  ".join(
+                f"{name} {case[name]['peak_mb']:7.1f} MB ({case[name]['peak_mb'] / audio_mb:4.1f}x)"
+                for name in renders
+            ))
+    await server.services.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Response serialization benchmark: pydantic response_model path vs the direct envelopes.
+
+For clips of several lengths, times turning a provider result into response bytes:
+    fastapi     base64 + TTSResponse validation + jsonable_encoder + JSONResponse (the old path)
+    json        base64 + serialization.dumps_json (orjson when installed)
+    msgpack     raw audio bytes in a MessagePack envelope (if msgpack is installed)
+    cbor        raw audio bytes in a CBOR envelope (if cbor2 is installed)
+
+Usage:
+    python benchmarks/serialization.py                 # human-readable report
+    python benchmarks/serialization.py --json out.json # also write machine-readable results
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Importing main creates the audio cache; keep it and any other state out of the working tree
+_state_dir = tempfile.TemporaryDirectory()
+os.environ.update({
+    "CACHE_DIR": str(Path(_state_dir.name) / "cache"),
+    "AUDIO_STORE_DIR": str(Path(_state_dir.name) / "objects"),
+    "PROFILE_DIR": str(Path(_state_dir.name) / "profiles"),
+    "SHARED_STATE_PATH": str(Path(_state_dir.name) / "state.db"),
+})
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import serialization  # noqa: E402
+from main import TTSResponse, _envelope  # noqa: E402
+
+# Bytes per second of audio: 64 kbps MP3 and 24 kHz 16-bit WAV
+BYTES_PER_SECOND = {"mp3": 8000, "wav": 48000}
+
+
+def _fastapi(result: dict) -> bytes:
+    payload = _envelope(result, "bench")
+    model = TTSResponse.model_validate(payload)
+    return bytes(JSONResponse(jsonable_encoder(model)).body)
+
+
+def _direct(media_type: str):
+    def encode(result: dict) -> bytes:
+        payload = _envelope(result, "bench", binary=serialization.binary(media_type))
+        return serialization.ENCODERS[media_type](payload)
+    return encode
+
+
+def measure(encode, result: dict, min_time: float) -> dict:
+    """Run encode repeatedly for at least min_time seconds and return per-call ms and output size."""
+    size = len(encode(result))
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        encode(result)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+    return {"ms_per_call": elapsed / runs * 1000, "bytes": size, "runs": runs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", default="10,60,300", help="Comma-separated clip lengths in seconds")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds to spend per measurement")
+    parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    encoders = {"fastapi": _fastapi, "json": _direct(serialization.JSON)}
+    if serialization.MSGPACK in serialization.ENCODERS:
+        encoders["msgpack"] = _direct(serialization.MSGPACK)
+    if serialization.CBOR in serialization.ENCODERS:
+        encoders["cbor"] = _direct(serialization.CBOR)
+
+    results = {
+        "python": sys.version.split()[0],
+        "orjson": serialization.orjson is not None,
+        "cases": [],
+    }
+    for audio_format, rate in BYTES_PER_SECOND.items():
+        for seconds in (int(s) for s in args.seconds.split(",")):
+            result = {
+                "audio_bytes": os.urandom(rate * seconds),
+                "audio_format": audio_format,
+                "duration_ms": seconds * 1000,
+                "metadata": json.dumps({"service": "bench", "voice": "Kore"}),
+            }
+            case = {"audio_format": audio_format, "seconds": seconds, "audio_bytes": len(result["audio_bytes"])}
+            case["encoders"] = {name: measure(encode, result, args.min_time) for name, encode in encoders.items()}
+            results["cases"].append(case)
+
+            baseline = case["encoders"]["fastapi"]["ms_per_call"]
+            print(f"{audio_format} {seconds:>4}s ({case['audio_bytes'] / 1e6:.1f} MB audio)")
+            for name, row in case["encoders"].items():
+                print(f"    {name:<8} {row['ms_per_call']:9.2f} ms  {row['bytes'] / 1e6:7.2f} MB  "
+                      f"{baseline / row['ms_per_call']:5.1f}x")
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Cold-start benchmark: import-time breakdown and server time-to-first-request.
+
+Usage:
+    python benchmarks/startup.py                 # human-readable report
+    python benchmarks/startup.py --json out.json # also write machine-readable results
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = BACKEND_DIR.parent.parent / "scripts"
+
+
+def import_breakdown(module: str, cwd: Path, top: int) -> dict:
+    """Import a module under -X importtime and return total and slowest cumulative imports (ms)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+            rows.append((name, int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue  # header line
+    total = next((cumulative for name, _, cumulative in rows if name == module), None)
+    slowest = sorted(rows, key=lambda row: row[2], reverse=True)[:top]
+    return {
+        "module": module,
+        "total_ms": total / 1000 if total is not None else None,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        "slowest": [{"name": name, "self_ms": s / 1000, "cumulative_ms": c / 1000} for name, s, c in slowest],
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_request(timeout: float = 30.0) -> float:
+    """Start the server in a fresh process and return ms until /health first answers."""
+    port = _free_port()
+    env = {**os.environ, "WARMUP_PROVIDERS": ""}
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError("server did not answer /health in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Server starts to take the median over")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list per module")
+    parser.add_argument("--json", dest="json_path", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = {
+        "python": sys.version.split()[0],
+        "imports": [
+            import_breakdown("main", BACKEND_DIR, args.top),
+            import_breakdown("services.gemini", BACKEND_DIR, args.top),
+            import_breakdown("services.openai", BACKEND_DIR, args.top),
+            import_breakdown("tts_gemini", SCRIPTS_DIR, args.top),
+            import_breakdown("tts_openai", SCRIPTS_DIR, args.top),
+        ],
+    }
+    samples = [time_to_first_request() for _ in range(args.runs)]
+    results["time_to_first_request_ms"] = {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "runs": args.runs,
+    }
+
+    for entry in results["imports"]:
+        total = f"{entry['total_ms']:.1f} ms" if entry["total_ms"] is not None else f"failed ({entry['error']})"
+        print(f"import {entry['module']}: {total}")
+        for row in entry["slowest"]:
+            print(f"    {row['cumulative_ms']:8.1f} ms  {row['name']}")
+    ttfr = results["time_to_first_request_ms"]
+    print(f"time to first request: median {ttfr['median']:.0f} ms (min {ttfr['min']:.0f}, max {ttfr['max']:.0f})")
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Content-addressed audio cache with an in-memory LRU backed by a disk tier."""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from shared_state import SharedStore
+
+
+def cache_key(**fields) -> str:
+    """Hash the request fields that affect the rendered audio into a stable key."""
+    canonical = json.dumps(fields, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _entry_size(entry: dict) -> int:
+    """Approximate the memory footprint of a cached result by its audio payload."""
+    return len(entry["audio_bytes"])
+
+
+class MemoryLRU:
+    """Size-bounded least-recently-used cache of synthesis results."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[str, Tuple[dict, int]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[dict]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        self._entries.move_to_end(key)
+        return item[0]
+
+    def put(self, key: str, entry: dict) -> None:
+        size = _entry_size(entry)
+        # Entries larger than the whole budget would only evict everything else
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (entry, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+
+class FileIndex:
+    """Files in a directory kept under a byte budget and a time-to-live since last access.
+
+    Sizes and access times live in a SQLite database in the directory, so worker
+    processes sharing the directory share one budget. Subclasses decide how keys
+    map to files.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, ttl_seconds: float):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._store = SharedStore(self.directory / "index.db")
+        with self._store.transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER, accessed REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            if db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0:
+                self._scan(db)
+
+    def __len__(self) -> int:
+        return self._store.connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @property
+    def total_bytes(self) -> int:
+        return self._store.connection().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _path(self, key: str) -> Path:
+        raise NotImplementedError
+
+    def _scan(self, db) -> None:
+        """Rebuild the index from files left by a run that predates it."""
+
+    def _contains(self, key: str) -> bool:
+        return self._store.connection().execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+
+    def _write(self, path: Path, *parts: bytes) -> None:
+        """Write a file atomically, so readers never see a partial one."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # The temp name is unique to this process and thread, so concurrent writers never interleave
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            for part in parts:
+                f.write(part)
+        os.replace(tmp, path)
+
+    def _record(self, key: str, size: int) -> None:
+        """Add or refresh an entry, then evict to stay within budget."""
+        with self._store.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, size, time.time()))
+            self._evict(db)
+
+    def _touch(self, key: str) -> bool:
+        """Mark an entry as used now; return False if it is not in the index."""
+        with self._store.transaction() as db:
+            return db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key)).rowcount > 0
+
+    def _discard(self, key: str) -> None:
+        with self._store.transaction() as db:
+            self._remove(db, [key])
+
+    def _remove(self, db, keys: list[str]) -> None:
+        for key in keys:
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, db) -> None:
+        """Drop expired entries, then least recently used ones until under budget."""
+        expired = db.execute("SELECT key FROM entries WHERE accessed < ?", (time.time() - self.ttl_seconds,))
+        self._remove(db, [row[0] for row in expired.fetchall()])
+        excess = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            if excess <= 0:
+                break
+            victims.append(key)
+            excess -= size
+        self._remove(db, victims)
+
+    def clear(self) -> None:
+        with self._store.transaction() as db:
+            self._remove(db, [row[0] for row in db.execute("SELECT key FROM entries").fetchall()])
+
+
+class DiskTier(FileIndex):
+    """On-disk cache tier with a time-to-live and a total byte budget.
+
+    Each entry is one file: a JSON metadata line followed by the raw audio bytes.
+    """
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.entry"
+
+    def _scan(self, db) -> None:
+        for path in self.directory.glob("*/*.entry"):
+            stat = path.stat()
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (path.stem, stat.st_size, stat.st_mtime))
+
+    def get(self, key: str) -> Optional[dict]:
+        if not self._contains(key):
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                record = json.loads(f.readline())
+                audio_bytes = f.read()
+        except (OSError, ValueError):
+            self._discard(key)
+            return None
+        if time.time() - record.pop("created_at") > self.ttl_seconds:
+            self._discard(key)
+            return None
+        self._touch(key)
+        return {"audio_bytes": audio_bytes, **record}
+
+    def put(self, key: str, entry: dict) -> None:
+        metadata = {k: v for k, v in entry.items() if k != "audio_bytes"}
+        header = json.dumps({"created_at": time.time(), **metadata}).encode("utf-8") + b"\n"
+        size = len(header) + len(entry["audio_bytes"])
+        if size > self.max_bytes:
+            return
+        self._write(self._path(key), header, entry["audio_bytes"])
+        self._record(key, size)
+
+
+class AudioCache:
+    """Two-tier cache: a memory LRU in front of a disk tier, with hit/miss counters."""
+
+    def __init__(self, memory_max_bytes: int, directory: Path, disk_max_bytes: int, ttl_seconds: float):
+        self.memory = MemoryLRU(memory_max_bytes)
+        self.disk = DiskTier(directory, disk_max_bytes, ttl_seconds)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # Sentence lookups in phrase mode, by outcome, and the characters they covered
+        self.phrases = {"hit": 0, "coalesced": 0, "miss": 0}
+        self.phrase_chars = {"hit": 0, "coalesced": 0, "miss": 0}
+
+    async def get(self, key: str) -> Tuple[Optional[dict], Optional[str]]:
+        """Look up a result, returning it with the tier that served it ("memory" or "disk")."""
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory_hits += 1
+            return entry, "memory"
+        # Disk reads run in a thread so they do not block the event loop
+        entry = await asyncio.to_thread(self.disk.get, key)
+        if entry is not None:
+            self.disk_hits += 1
+            self.memory.put(key, entry)
+            return entry, "disk"
+        self.misses += 1
+        return None, None
+
+    def record_phrase(self, chars: int, outcome: str) -> None:
+        """Count a sentence lookup: "hit", "coalesced" (shared a concurrent miss) or "miss"."""
+        self.phrases[outcome] += 1
+        self.phrase_chars[outcome] += chars
+
+    async def put(self, key: str, entry: dict) -> None:
+        """Store a result in both tiers."""
+        self.memory.put(key, entry)
+        await asyncio.to_thread(self.disk.put, key, entry)
+
+    async def purge(self) -> None:
+        """Remove every entry from both tiers."""
+        self.memory.clear()
+        await asyncio.to_thread(self.disk.clear)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the size of each tier."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        phrases = sum(self.phrases.values())
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory": {"entries": len(self.memory), "bytes": self.memory.bytes, "max_bytes": self.memory.max_bytes},
+            "disk": {
+                "entries": len(self.disk),
+                "bytes": self.disk.total_bytes,
+                "max_bytes": self.disk.max_bytes,
+                "ttl_seconds": self.disk.ttl_seconds,
+            },
+            "phrases": {
+                **self.phrases,
+                "hit_rate": self.phrases["hit"] / phrases if phrases else 0.0,
+                "upstream_chars": self.phrase_chars["miss"],
+                "upstream_chars_saved": self.phrase_chars["hit"] + self.phrase_chars["coalesced"],
+            },
+        }
@@ -0,0 +1,68 @@
+"""In-flight request coalescing ("singleflight") for identical upstream calls."""
+import asyncio
+from typing import Any, Awaitable, Callable, Tuple
+
+
+class _Call:
+    """One shared upstream call and the number of callers waiting on it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its result.
+
+    The shared call runs as its own task, so one caller going away does not cancel
+    it for the others. It is cancelled only once every waiter has been cancelled.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Await fn() for key, or join an identical call already in flight.
+
+        Returns the result and whether it was shared with an earlier caller.
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                # Last interested caller left; stop the upstream work. Forget it now:
+                # cancelling takes a few loop iterations, and a caller arriving
+                # meanwhile must start a fresh call instead of joining a dying one.
+                self._forget(key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        """Return upstream call and coalescing counters."""
+        return {
+            "in_flight": len(self._calls),
+            "upstream_calls": self.calls,
+            "coalesced": self.coalesced,
+        }
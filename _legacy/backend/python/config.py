@@ -1,14 +1,17 @@
 """Configuration management using environment variables."""
+import json
 import os
 from pathlib import Path
-from dotenv import load_dotenv
 
 # Get the directory where this config file is located
 CONFIG_DIR = Path(__file__).parent
 
 # Load .env file from the same directory as this config file
+# (python-dotenv is only imported when there is a file to load)
 env_path = CONFIG_DIR / ".env"
-load_dotenv(dotenv_path=env_path)
+if env_path.exists():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=env_path)
 
 # API Keys
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -21,8 +24,154 @@ if not os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
     if service_account_path.exists():
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(service_account_path)
 
+# Upstream endpoints, overridable to go through a proxy or to the offline
+# stand-ins in benchmarks/ (the OpenAI SDK reads OPENAI_BASE_URL itself)
+GEMINI_API_URL = os.getenv("GEMINI_API_URL", "https://texttospeech.googleapis.com/v1/text:synthesize")
+
 # Server configuration
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8000"))
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
+# Worker processes for `python main.py` (uvicorn's own WEB_CONCURRENCY is honoured too)
+WORKERS = int(os.getenv("WORKERS", os.getenv("WEB_CONCURRENCY", "1")))
+
+# State shared by all workers on the host (Google access token, rate-limit
+# buckets) lives in this SQLite file; enabled by default with more than one worker
+SHARED_STATE_ENABLED = os.getenv("SHARED_STATE_ENABLED", str(WORKERS > 1)).lower() == "true"
+SHARED_STATE_PATH = Path(os.getenv("SHARED_STATE_PATH", str(CONFIG_DIR / ".cache" / "state.db")))
+
+
+# Upstream HTTP connection pool
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30.0"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5.0"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30.0"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "10.0"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5.0"))
+
+# Maximum number of concurrent upstream OpenAI requests per worker
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+
+# Audio cache
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_MEMORY_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_DIR = Path(os.getenv("CACHE_DIR", str(CONFIG_DIR / ".cache" / "audio")))
+CACHE_DISK_MAX_BYTES = int(os.getenv("CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Audio object store: with AUDIO_STORE_ENABLED, `url=true` on /api/v1/tts/synthesize
+# stores the audio under its content hash and returns audio_url instead of
+# audio_data. Objects expire AUDIO_STORE_TTL_SECONDS after their last fetch.
+# AUDIO_STORE_PUBLIC_URL replaces this server's address in the URLs (e.g. a CDN);
+# AUDIO_STORE_ACCEL_REDIRECT names an nginx internal location mapped to
+# AUDIO_STORE_DIR, so nginx sends the files instead of the app.
+AUDIO_STORE_ENABLED = os.getenv("AUDIO_STORE_ENABLED", "false").lower() == "true"
+AUDIO_STORE_DIR = Path(os.getenv("AUDIO_STORE_DIR", str(CONFIG_DIR / ".cache" / "objects")))
+AUDIO_STORE_MAX_BYTES = int(os.getenv("AUDIO_STORE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+AUDIO_STORE_TTL_SECONDS = float(os.getenv("AUDIO_STORE_TTL_SECONDS", str(30 * 24 * 3600)))
+AUDIO_STORE_PUBLIC_URL = os.getenv("AUDIO_STORE_PUBLIC_URL")
+AUDIO_STORE_ACCEL_REDIRECT = os.getenv("AUDIO_STORE_ACCEL_REDIRECT")
+AUDIO_INDEX_INTERVAL_MS = int(os.getenv("AUDIO_INDEX_INTERVAL_MS", "1000"))
+
+# Normalize text and render it sentence by sentence, caching each sentence, so
+# templated requests only send their new sentences upstream (needs CACHE_ENABLED)
+PHRASE_CACHE_ENABLED = os.getenv("PHRASE_CACHE_ENABLED", "false").lower() == "true"
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Profiling of synthesis requests: requests sent with X-Profile: true and a
+# valid X-Admin-Token, and a random PROFILE_SAMPLE_RATE fraction of all of them,
+# run under a sampling profiler. The newest PROFILE_MAX_FILES profiles are kept
+# and served at /api/v1/admin/profiles.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(CONFIG_DIR / ".cache" / "profiles")))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+# Number of sentence segments rendered ahead of the one being streamed (Gemini)
+GEMINI_STREAM_PREFETCH = int(os.getenv("GEMINI_STREAM_PREFETCH", "2"))
+
+# Long-document synthesis
+LONGFORM_MAX_CHARS = int(os.getenv("LONGFORM_MAX_CHARS", "200000"))
+LONGFORM_CONCURRENCY = int(os.getenv("LONGFORM_CONCURRENCY", "4"))
+
+# Batch synthesis
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_GEMINI_CONCURRENCY = int(os.getenv("BATCH_GEMINI_CONCURRENCY", "8"))
+BATCH_OPENAI_CONCURRENCY = int(os.getenv("BATCH_OPENAI_CONCURRENCY", "8"))
+
+# Google access tokens are refreshed this many seconds before they expire;
+# failed refreshes are retried with exponential backoff between these bounds
+GOOGLE_TOKEN_REFRESH_MARGIN = float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+GOOGLE_TOKEN_RETRY_INITIAL = float(os.getenv("GOOGLE_TOKEN_RETRY_INITIAL", "1.0"))
+GOOGLE_TOKEN_RETRY_MAX = float(os.getenv("GOOGLE_TOKEN_RETRY_MAX", "60.0"))
+
+# Providers to import and pre-authenticate in the background after startup,
+# e.g. "gemini,openai" (empty: load each provider on its first request)
+WARMUP_PROVIDERS = [p.strip() for p in os.getenv("WARMUP_PROVIDERS", "").split(",") if p.strip()]
+
+# Local transcoding: render one canonical WAV upstream and encode other formats
+# with ffmpeg. Disabled automatically when the ffmpeg binary cannot be found.
+TRANSCODE_ENABLED = os.getenv("TRANSCODE_ENABLED", "true").lower() == "true"
+TRANSCODE_FFMPEG = os.getenv("TRANSCODE_FFMPEG", "ffmpeg")
+TRANSCODE_MAX_WORKERS = int(os.getenv("TRANSCODE_MAX_WORKERS", str(os.cpu_count() or 2)))
+
+# Provider routing for service="auto"
+ROUTING_EWMA_ALPHA = float(os.getenv("ROUTING_EWMA_ALPHA", "0.2"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "2.0"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Equivalent voices between providers, as a JSON object of Gemini -> OpenAI names
+AUTO_VOICE_MAP = json.loads(os.getenv("AUTO_VOICE_MAP", json.dumps({
+    "Kore": "alloy",
+    "Aoede": "nova",
+    "Leda": "shimmer",
+    "Puck": "echo",
+    "Charon": "onyx",
+    "Fenrir": "fable",
+})))
+
+# Client-side upstream rate limits per provider (0 disables a limit). Requests
+# wait in a bounded queue for their turn and are shed with 503 + Retry-After
+# when the queue is full or the wait would exceed UPSTREAM_MAX_QUEUE_WAIT.
+GEMINI_REQUESTS_PER_SECOND = float(os.getenv("GEMINI_REQUESTS_PER_SECOND", "15"))
+GEMINI_CHARS_PER_MINUTE = float(os.getenv("GEMINI_CHARS_PER_MINUTE", "0"))
+OPENAI_REQUESTS_PER_SECOND = float(os.getenv("OPENAI_REQUESTS_PER_SECOND", "8"))
+OPENAI_CHARS_PER_MINUTE = float(os.getenv("OPENAI_CHARS_PER_MINUTE", "0"))
+UPSTREAM_MAX_QUEUE = int(os.getenv("UPSTREAM_MAX_QUEUE", "100"))
+UPSTREAM_MAX_QUEUE_WAIT = float(os.getenv("UPSTREAM_MAX_QUEUE_WAIT", "10.0"))
+
+# Retries of throttled or failed upstream calls, with jittered exponential backoff
+UPSTREAM_RETRY_ATTEMPTS = int(os.getenv("UPSTREAM_RETRY_ATTEMPTS", "3"))
+UPSTREAM_RETRY_INITIAL = float(os.getenv("UPSTREAM_RETRY_INITIAL", "0.5"))
+UPSTREAM_RETRY_MAX = float(os.getenv("UPSTREAM_RETRY_MAX", "8.0"))
+
+# Request deadlines: clients may send X-Request-Timeout (seconds, capped at the
+# maximum); without it, interactive requests get the default and document and
+# batch requests the maximum. Upstream work stops when the deadline passes or
+# the client disconnects.
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "60"))
+REQUEST_TIMEOUT_MAX_SECONDS = float(os.getenv("REQUEST_TIMEOUT_MAX_SECONDS", "600"))
+
+# Large payloads: upstream audio beyond AUDIO_SPOOL_MAX_MEMORY_BYTES is collected
+# in a temporary file instead of growing buffers, and JSON responses carrying
+# more audio than ENVELOPE_STREAM_MIN_BYTES are base64-encoded while being sent
+AUDIO_SPOOL_MAX_MEMORY_BYTES = int(os.getenv("AUDIO_SPOOL_MAX_MEMORY_BYTES", str(1024 * 1024)))
+ENVELOPE_STREAM_MIN_BYTES = int(os.getenv("ENVELOPE_STREAM_MIN_BYTES", str(1024 * 1024)))
+
+# Prometheus metrics at /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Incremental synthesis over WebSocket: text without a sentence end is spoken
+# at a clause boundary once it passes WS_CLAUSE_BYTES; up to WS_PREFETCH
+# segments are synthesized ahead of the one being sent
+WS_CLAUSE_BYTES = int(os.getenv("WS_CLAUSE_BYTES", "160"))
+WS_PREFETCH = int(os.getenv("WS_PREFETCH", "2"))
+WS_MAX_QUEUED_SEGMENTS = int(os.getenv("WS_MAX_QUEUED_SEGMENTS", "32"))
@@ -0,0 +1,75 @@
+"""Per-request deadlines, carried down to the provider calls in a context variable.
+
+The deadline is set once per request and inherited by every task the request
+starts, so rate-limit queues, retries and upstream HTTP timeouts can all stop
+at the point where the client would no longer use the answer.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from fastapi import HTTPException
+
+from config import HTTP_CONNECT_TIMEOUT, HTTP_POOL_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_WRITE_TIMEOUT
+
+if TYPE_CHECKING:
+    import httpx
+
+# Monotonic time by which the current request must finish, if any
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(HTTPException):
+    """Raised when a request runs out of time before or while calling upstream."""
+
+    def __init__(self, detail: str = "Request deadline exceeded"):
+        super().__init__(504, detail)
+
+
+def parse_timeout(value: Optional[str], default: float, maximum: float) -> float:
+    """Return the seconds requested in an X-Request-Timeout header, capped at maximum."""
+    if value is None:
+        return min(default, maximum)
+    try:
+        seconds = float(value)
+    except ValueError:
+        raise HTTPException(400, "X-Request-Timeout must be a number of seconds")
+    if seconds <= 0:
+        raise HTTPException(400, "X-Request-Timeout must be positive")
+    return min(seconds, maximum)
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """Set the deadline for the current request and the tasks it starts."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Return the seconds left before the current deadline, or None without one."""
+    end = _deadline.get()
+    if end is None:
+        return None
+    return max(0.0, end - time.monotonic())
+
+
+def http_timeout() -> Optional["httpx.Timeout"]:
+    """Return per-phase upstream timeouts shortened to the time left, or None without a deadline."""
+    left = remaining()
+    if left is None:
+        return None
+    if left <= 0:
+        raise DeadlineExceeded()
+    # Imported here: only the provider modules, which load lazily, call this
+    import httpx
+    return httpx.Timeout(
+        connect=min(HTTP_CONNECT_TIMEOUT, left),
+        read=min(HTTP_READ_TIMEOUT, left),
+        write=min(HTTP_WRITE_TIMEOUT, left),
+        pool=min(HTTP_POOL_TIMEOUT, left),
+    )
@@ -0,0 +1,46 @@
+"""Long-document synthesis: split text into chunks, render them concurrently, join in order."""
+import asyncio
+from typing import Awaitable, Callable
+
+from audio import concat_audio
+from segmentation import chunk_text
+
+
+async def render_document(params: dict, render: Callable[[dict], Awaitable[dict]],
+                          max_bytes: int, concurrency: int) -> dict:
+    """Render a long text as provider-sized chunks and join the audio into one result.
+    
+    `render` receives the provider parameters with `text` replaced by each chunk and
+    returns a raw result. At most `concurrency` chunks are in flight at once, so wall
+    time grows with the number of chunks divided by the concurrency.
+    """
+    return await render_segments(params, chunk_text(params["text"], max_bytes), render, concurrency)
+
+
+async def render_segments(params: dict, segments: list[str], render: Callable[[dict], Awaitable[dict]],
+                          concurrency: int) -> dict:
+    """Render each text segment with `render`, at most `concurrency` at once, and join them in order."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def render_chunk(chunk: str) -> dict:
+        async with semaphore:
+            return await render({**params, "text": chunk})
+
+    tasks = [asyncio.create_task(render_chunk(chunk)) for chunk in segments]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # One failed chunk fails the document; stop spending upstream quota on the rest
+        for task in tasks:
+            task.cancel()
+        raise
+
+    audio_format = params["audio_format"]
+    audio_bytes = await asyncio.to_thread(concat_audio, [r["audio_bytes"] for r in results], audio_format)
+    return {
+        "audio_bytes": audio_bytes,
+        "audio_format": audio_format,
+        "duration_ms": sum(r["duration_ms"] for r in results),
+        "metadata": results[0].get("metadata"),
+        "chunks": len(results),
+    }
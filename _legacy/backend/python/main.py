@@ -1,26 +1,119 @@
 """Simple TTS backend - calls Gemini or OpenAI TTS APIs."""
 import sys
 import os
+import asyncio
+import base64
+import json
+import logging
+import time
 
 # Add current directory to Python path to allow imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from fastapi import FastAPI, HTTPException
+from collections import deque
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Awaitable, Callable, Iterator, Optional, Tuple, TypeVar
 
-from config import HOST, PORT, DEBUG
-from services import synthesize_gemini, synthesize_openai
+from config import (
+    HOST, PORT, DEBUG, WORKERS, ADMIN_TOKEN,
+    PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS, PROFILE_DIR, PROFILE_MAX_FILES,
+    CACHE_ENABLED, CACHE_MEMORY_MAX_BYTES, CACHE_DIR, CACHE_DISK_MAX_BYTES, CACHE_TTL_SECONDS,
+    PHRASE_CACHE_ENABLED,
+    AUDIO_STORE_ENABLED, AUDIO_STORE_DIR, AUDIO_STORE_MAX_BYTES, AUDIO_STORE_TTL_SECONDS,
+    AUDIO_STORE_PUBLIC_URL, AUDIO_STORE_ACCEL_REDIRECT, AUDIO_INDEX_INTERVAL_MS,
+    LONGFORM_MAX_CHARS, LONGFORM_CONCURRENCY,
+    BATCH_MAX_ITEMS, BATCH_GEMINI_CONCURRENCY, BATCH_OPENAI_CONCURRENCY,
+    WARMUP_PROVIDERS,
+    ROUTING_EWMA_ALPHA, HEDGE_ENABLED, HEDGE_MIN_SAMPLES, HEDGE_DEFAULT_DELAY,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS, AUTO_VOICE_MAP,
+    METRICS_ENABLED, ENVELOPE_STREAM_MIN_BYTES,
+    WS_CLAUSE_BYTES, WS_PREFETCH, WS_MAX_QUEUED_SEGMENTS,
+    REQUEST_TIMEOUT_SECONDS, REQUEST_TIMEOUT_MAX_SECONDS,
+)
+import services
+from cache import AudioCache, cache_key
+from audio import MEDIA_TYPES, audio_duration_ms, media_type
+from objects import AudioFileResponse, AudioStore
+from profiling import ProfileStore, ProfilingMiddleware
+import serialization
+from longform import render_document, render_segments
+from coalescing import SingleFlight
+import transcode
+from transcode import CANONICAL_FORMAT
+from routing import Router, is_provider_failure
+from services.limits import Overloaded, measure_local_wait
+import metrics
+from metrics import (
+    phrase_chars, request_bytes, requests_abandoned, response_bytes, stage_seconds, upstream_calls,
+    upstream_in_flight,
+)
+from deadlines import DeadlineExceeded, deadline, parse_timeout, remaining
+from segmentation import SentenceBuffer, normalize_text, split_sentences, text_size
 
-app = FastAPI(title="TTS Backend", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Optionally warm up providers in the background; close their connections on shutdown."""
+    warm_up = asyncio.create_task(services.warm_up(WARMUP_PROVIDERS)) if WARMUP_PROVIDERS else None
+    try:
+        yield
+    finally:
+        if warm_up is not None:
+            warm_up.cancel()
+        await services.shutdown()
+
+
+app = FastAPI(title="TTS Backend", version="1.0.0", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES)
+if ADMIN_TOKEN or PROFILE_SAMPLE_RATE > 0:
+    app.add_middleware(ProfilingMiddleware, store=profile_store, admin_token=ADMIN_TOKEN,
+                       sample_rate=PROFILE_SAMPLE_RATE, interval_ms=PROFILE_INTERVAL_MS)
+
+audio_cache: Optional[AudioCache] = (
+    AudioCache(CACHE_MEMORY_MAX_BYTES, CACHE_DIR, CACHE_DISK_MAX_BYTES, CACHE_TTL_SECONDS)
+    if CACHE_ENABLED else None
+)
+audio_store: Optional[AudioStore] = (
+    AudioStore(AUDIO_STORE_DIR, AUDIO_STORE_MAX_BYTES, AUDIO_STORE_TTL_SECONDS, AUDIO_INDEX_INTERVAL_MS)
+    if AUDIO_STORE_ENABLED else None
+)
+# Identical requests in flight at the same time share one upstream call
+in_flight = SingleFlight()
+
+# Provider health and latency, used to route service="auto" requests
+router = Router(
+    services.PROVIDERS,
+    alpha=ROUTING_EWMA_ALPHA,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=CIRCUIT_RESET_SECONDS,
+    hedge_min_samples=HEDGE_MIN_SAMPLES,
+    hedge_default_delay=HEDGE_DEFAULT_DELAY,
+)
+
+# Reverse of AUTO_VOICE_MAP, for OpenAI voices routed to Gemini
+_OPENAI_TO_GEMINI_VOICES = {openai_voice: gemini_voice for gemini_voice, openai_voice in AUTO_VOICE_MAP.items()}
+
+# Per-provider limits on concurrent batch items, separate from interactive traffic
+_batch_semaphores = {
+    "gemini": asyncio.Semaphore(BATCH_GEMINI_CONCURRENCY),
+    "openai": asyncio.Semaphore(BATCH_OPENAI_CONCURRENCY),
+}
+
 
 # Request/Response models
 class TTSRequest(BaseModel):
     text: str = Field(..., min_length=1, max_length=5000)
-    service: str = Field(..., pattern="^(gemini|openai)$")
+    service: str = Field(..., pattern="^(gemini|openai|auto)$")  # auto: fastest healthy provider
     voice: Optional[str] = None
     language: Optional[str] = None
     audio_format: str = Field(default="mp3", pattern="^(mp3|wav|ogg|opus|aac|flac)$")
@@ -29,45 +122,908 @@ class TTSRequest(BaseModel):
     speed: Optional[float] = Field(None, ge=0.25, le=4.0)  # For OpenAI
 
 
+class DocumentTTSRequest(TTSRequest):
+    text: str = Field(..., min_length=1, max_length=LONGFORM_MAX_CHARS)
+
+
 class TTSResponse(BaseModel):
-    audio_data: str
+    audio_data: Optional[str] = None
+    audio_url: Optional[str] = None  # Instead of audio_data with url=true
     audio_format: str
     duration_ms: int
     metadata: Optional[str] = None
 
 
+class BatchTTSRequest(BaseModel):
+    items: list[TTSRequest] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    status_code: int
+    result: Optional[TTSResponse] = None
+    error: Optional[str] = None
+
+
+class BatchTTSResponse(BaseModel):
+    results: list[BatchItemResult]
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Allow admin endpoints only when ADMIN_TOKEN is set and matches the request header."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(403, "Admin endpoints disabled. Set ADMIN_TOKEN in .env")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(401, "Invalid admin token")
+
+
+def _voice_for(service: str, voice: Optional[str]) -> Optional[str]:
+    """Map a voice named for either provider to its equivalent on service."""
+    if voice is None:
+        return None
+    if service == "openai":
+        return AUTO_VOICE_MAP.get(voice, voice)
+    return _OPENAI_TO_GEMINI_VOICES.get(voice, voice)
+
+
+def _provider_params(request: TTSRequest, service: Optional[str] = None) -> dict:
+    """Resolve per-service defaults into the keyword arguments passed to the provider.
+
+    `service` picks the provider for an "auto" request, whose voice is then
+    mapped to that provider's equivalent.
+    """
+    service = service or request.service
+    voice = _voice_for(service, request.voice) if request.service == "auto" else request.voice
+
+    if service == "gemini":
+        return {
+            "text": request.text,
+            "voice": voice or "Kore",
+            "language": request.language or "en-US",
+            "audio_format": request.audio_format,
+            "prompt": request.prompt,
+        }
+
+    elif service == "openai":
+        return {
+            "text": request.text,
+            "voice": voice or "alloy",
+            "language": request.language,
+            "audio_format": request.audio_format,
+            "speed": request.speed or 1.0,
+            "instructions": request.instructions,
+        }
+
+    else:
+        raise HTTPException(400, f"Unknown service: {service}")
+
+
+async def _dispatch(service: str, params: dict) -> dict:
+    """Call the upstream provider for a resolved request and return raw audio bytes.
+
+    Every upstream call feeds the router's error statistics and is counted as
+    completed, failed or cancelled. Latency samples cover the time spent upstream
+    only, without local rate limit queueing and backoff, and only calls the
+    provider answered count: caller errors say nothing about its speed.
+    """
+    router.begin(service)
+    request_bytes.observe(text_size(params["text"]), service)
+    upstream_in_flight.inc(service)
+    start = time.perf_counter()
+
+    def upstream_ms() -> float:
+        return (time.perf_counter() - start - waited.seconds) * 1000
+
+    with measure_local_wait() as waited:
+        try:
+            provider = await services.get_provider(service)
+            # Importing the provider on first use is not upstream time either
+            waited.seconds += time.perf_counter() - start
+            result = await provider.render(**params)
+        except (Overloaded, DeadlineExceeded):
+            # Given up locally before reaching the provider; says nothing about its health
+            router.abandon(service)
+            raise
+        except HTTPException as e:
+            if is_provider_failure(e.status_code):
+                router.record(service, upstream_ms(), ok=False)
+            else:
+                # A caller error, answered without synthesizing anything
+                router.abandon(service)
+            upstream_calls.inc(service, "failed")
+            raise
+        except asyncio.CancelledError:
+            router.abandon(service)
+            upstream_calls.inc(service, "cancelled")
+            raise
+        except Exception:
+            router.record(service, upstream_ms(), ok=False)
+            upstream_calls.inc(service, "failed")
+            raise
+        finally:
+            upstream_in_flight.dec(service)
+    router.record(service, upstream_ms(), ok=True)
+    upstream_calls.inc(service, "completed")
+    # Providers estimate duration from the word count; MP3 and WAV can be measured
+    duration_ms = audio_duration_ms(result["audio_bytes"], result["audio_format"])
+    if duration_ms is not None:
+        result["duration_ms"] = duration_ms
+    return result
+
+
+def _resolve_service(request: TTSRequest) -> str:
+    """Return the provider for a request, picking the best available one for "auto"."""
+    if request.service != "auto":
+        return request.service
+    ranked = router.ranked()
+    if not ranked:
+        raise HTTPException(
+            503, "No TTS provider is currently available",
+            headers={"Retry-After": str(int(CIRCUIT_RESET_SECONDS))},
+        )
+    return ranked[0]
+
+
+async def _render_auto(request: TTSRequest) -> Tuple[dict, dict]:
+    """Render on the fastest healthy provider, hedging to the next one past its p95 latency.
+
+    If the first provider fails, the request fails over to the next one; if it is
+    merely slow, both race and the loser is cancelled. A 400 also fails over, since
+    a voice or format one provider rejects may be served by the other.
+    """
+    candidates = deque(router.ranked()[:2])
+    if not candidates:
+        _resolve_service(request)
+    pending: dict[asyncio.Task, str] = {}
+
+    def launch() -> None:
+        service = candidates.popleft()
+        pending[asyncio.create_task(_render_text(service, _provider_params(request, service)))] = service
+
+    launch()
+    hedge_delay = router.hedge_delay(pending[next(iter(pending))]) if HEDGE_ENABLED else None
+    hedged = False
+    last_error: Optional[HTTPException] = None
+    try:
+        while pending:
+            timeout = hedge_delay if candidates and not hedged else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                router.hedges += 1
+                launch()
+                continue
+            for task in done:
+                service = pending.pop(task)
+                try:
+                    result, headers = task.result()
+                except HTTPException as e:
+                    if not is_provider_failure(e.status_code) and e.status_code != 400:
+                        raise
+                    last_error = e
+                    continue
+                headers["X-Provider"] = service
+                if hedged:
+                    headers["X-Hedged"] = "true"
+                return result, headers
+            if not pending and candidates:
+                # Fail over to the next provider
+                launch()
+        raise last_error or HTTPException(503, "No TTS provider is currently available")
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _render(request: TTSRequest) -> Tuple[dict, dict]:
+    """Render a request through routing, caching and coalescing."""
+    if request.service == "auto":
+        return await _render_auto(request)
+    return await _render_text(request.service, _provider_params(request))
+
+
+async def _render_text(service: str, params: dict) -> Tuple[dict, dict]:
+    """Render on one provider, sentence by sentence when the phrase cache is enabled."""
+    if PHRASE_CACHE_ENABLED and audio_cache is not None:
+        return await _render_phrases(audio_cache, service, params)
+    return await _render_cached(service, params)
+
+
+async def _render_phrases(cache: AudioCache, service: str, params: dict) -> Tuple[dict, dict]:
+    """Render normalized text one sentence at a time through the cache and join the audio.
+
+    Each sentence is cached under the request's voice, language and style, so a
+    templated request only sends its new sentences upstream. X-Phrases and
+    X-Phrases-Cached report the split. When local transcoding is available,
+    sentences are cached as WAV and the joined audio is encoded once.
+    """
+    text = normalize_text(params["text"])
+    sentences = split_sentences(text, await _max_input_bytes(service))
+    if not sentences:
+        return await _render_cached(service, params)
+    audio_format = params["audio_format"]
+    if len(sentences) > 1 and _transcodes(audio_format):
+        params = {**params, "audio_format": CANONICAL_FORMAT}
+    cached = 0
+
+    async def render(sentence_params: dict) -> dict:
+        nonlocal cached
+        result, headers = await _render_cached(service, sentence_params)
+        if headers.get("X-Cache") == "HIT":
+            outcome = "hit"
+            cached += 1
+        else:
+            outcome = "coalesced" if headers.get("X-Coalesced") else "miss"
+        cache.record_phrase(len(sentence_params["text"]), outcome)
+        phrase_chars.inc(service, outcome, amount=len(sentence_params["text"]))
+        return result
+
+    if len(sentences) == 1:
+        result = await render({**params, "text": sentences[0]})
+    else:
+        result = await render_segments(params, sentences, render, LONGFORM_CONCURRENCY)
+        result.pop("chunks")
+        if result["audio_format"] != audio_format:
+            result = await _transcode_result(result, audio_format)
+    return result, {
+        "X-Cache": "HIT" if cached == len(sentences) else "MISS",
+        "X-Phrases": str(len(sentences)),
+        "X-Phrases-Cached": str(cached),
+    }
+
+
+async def _max_input_bytes(service: str) -> int:
+    """Return the largest text chunk the provider accepts in one call."""
+    return (await services.get_provider(service)).MAX_INPUT_BYTES
+
+
+def _transcodes(audio_format: str) -> bool:
+    """Return True if audio_format should be encoded locally from a canonical render."""
+    return audio_format != CANONICAL_FORMAT and transcode.available() and transcode.supports(audio_format)
+
+
+async def _transcode_result(result: dict, audio_format: str) -> dict:
+    """Encode a canonical result into audio_format, keeping its other fields."""
+    try:
+        audio_bytes = await transcode.transcode(result["audio_bytes"], audio_format)
+    except transcode.TranscodeError as e:
+        raise HTTPException(500, f"Transcoding to {audio_format} failed: {e}")
+    return {**result, "audio_bytes": audio_bytes, "audio_format": audio_format}
+
+
+async def _render_cached(service: str, params: dict) -> Tuple[dict, dict]:
+    """Render through the audio cache, returning the result and its X-Cache headers.
+
+    Cache misses are coalesced: concurrent identical requests wait on a single
+    upstream call, reported with an X-Coalesced header. When local transcoding
+    is available, non-WAV formats are encoded from a cached canonical WAV
+    render, so switching formats never costs another provider call.
+    """
+    key = cache_key(service=service, **params)
+    headers: dict = {}
+
+    if audio_cache is not None:
+        result, tier = await audio_cache.get(key)
+        if result is not None:
+            return result, {"X-Cache": "HIT", "X-Cache-Tier": tier or ""}
+        headers["X-Cache"] = "MISS"
+
+    audio_format = params["audio_format"]
+    if _transcodes(audio_format):
+        canonical, canonical_headers = await _render_cached(service, {**params, "audio_format": CANONICAL_FORMAT})
+        headers["X-Transcoded-From"] = CANONICAL_FORMAT
+        headers["X-Canonical-Cache"] = canonical_headers.get("X-Cache", "DISABLED")
+
+        async def render() -> dict:
+            result = await _transcode_result(canonical, audio_format)
+            if audio_cache is not None:
+                await audio_cache.put(key, result)
+            return result
+    else:
+        async def render() -> dict:
+            result = await _dispatch(service, params)
+            if audio_cache is not None:
+                await audio_cache.put(key, result)
+            return result
+
+    result, shared = await in_flight.do(key, render)
+    if shared:
+        headers["X-Coalesced"] = "true"
+    return result, headers
+
+
+def _request_timeout(x_request_timeout: Optional[str], default: float = REQUEST_TIMEOUT_SECONDS) -> float:
+    """Return the request's deadline in seconds from its X-Request-Timeout header."""
+    return parse_timeout(x_request_timeout, default, REQUEST_TIMEOUT_MAX_SECONDS)
+
+
+async def _until_disconnected(request: Request) -> None:
+    """Return once the client has closed the connection."""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _cancel_on_disconnect(request: Request, work: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Await work, cancelling it as soon as the client disconnects or `timeout` passes.
+
+    Call inside deadline() so that the work, started here as a task, inherits the
+    deadline. A coalesced upstream call keeps running while other requests still
+    wait on it, and stays under the deadline of the request that started it.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_until_disconnected(request))
+    try:
+        done, _ = await asyncio.wait({task, watcher}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if task in done:
+        return task.result()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    if watcher in done:
+        requests_abandoned.inc("disconnect")
+        # Nobody will read the response; 499 only shows up in access logs
+        raise HTTPException(499, "Client closed request")
+    requests_abandoned.inc("deadline")
+    raise DeadlineExceeded()
+
+
+def _audio_response(result: dict, headers: dict) -> Response:
+    """Return raw audio bytes with the JSON metadata fields moved into headers."""
+    headers = {
+        **headers,
+        "X-Audio-Format": result["audio_format"],
+        "X-Audio-Duration-Ms": str(result["duration_ms"]),
+    }
+    if result.get("metadata"):
+        headers["X-Audio-Metadata"] = result["metadata"]
+    return Response(result["audio_bytes"], media_type=media_type(result["audio_format"]), headers=headers)
+
+
+def _respond(result: dict, headers: dict, service: str, response_type: str) -> Response:
+    """Return raw audio, or the result in the negotiated envelope, carrying the given headers.
+
+    Envelopes are serialized straight from the result dict; the audio payload is
+    never validated or copied through a pydantic model. JSON envelopes for large
+    clips are base64-encoded chunk by chunk while being sent.
+    """
+    if response_type == "audio":
+        response_bytes.observe(len(result["audio_bytes"]), service)
+        return _audio_response(result, headers)
+    if response_type == serialization.JSON and len(result["audio_bytes"]) >= ENVELOPE_STREAM_MIN_BYTES:
+        fields = _envelope(result, service, binary=True)
+        del fields["audio_data"]
+        size, chunks = serialization.stream_json(result["audio_bytes"], fields)
+        response_bytes.observe(size, service)
+        headers = {**headers, "Vary": "Accept", "Content-Length": str(size)}
+        return StreamingResponse(_timed_encode(chunks, service), media_type=response_type, headers=headers)
+    payload = _envelope(result, service, binary=serialization.binary(response_type))
+    with stage_seconds.time(service, "serialize"):
+        body = serialization.ENCODERS[response_type](payload)
+    response_bytes.observe(len(body), service)
+    return Response(body, media_type=response_type, headers={**headers, "Vary": "Accept"})
+
+
+def _timed_encode(chunks: Iterator[bytes], service: str) -> Iterator[bytes]:
+    """Pass on streamed JSON chunks, observing the time spent encoding them as one "encode" sample."""
+    seconds = 0.0
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        yield chunk
+    stage_seconds.observe(seconds, service, "encode")
+
+
+async def _stored_response(result: dict, headers: dict, service: str, response_type: str,
+                           http_request: Request) -> Response:
+    """Store the audio and return the result's envelope with audio_url in place of audio_data."""
+    if audio_store is None:
+        raise HTTPException(400, "Audio store disabled. Set AUDIO_STORE_ENABLED=true in .env")
+    name = await asyncio.to_thread(audio_store.put, result["audio_bytes"], result["audio_format"])
+    if AUDIO_STORE_PUBLIC_URL:
+        url = f"{AUDIO_STORE_PUBLIC_URL.rstrip('/')}/api/v1/audio/{name}"
+    else:
+        url = str(http_request.url_for("get_audio", name=name))
+    payload = _envelope(result, service, binary=True)
+    del payload["audio_data"]
+    payload = {"audio_url": url, **payload}
+    if response_type == "audio":
+        response_type = serialization.JSON
+    body = serialization.ENCODERS[response_type](payload)
+    response_bytes.observe(len(body), service)
+    return Response(body, media_type=response_type, headers={**headers, "Vary": "Accept"})
+
+
+def _envelope(result: dict, service: str, binary: bool = False) -> dict:
+    """Shape a raw result like TTSResponse, with base64 audio unless the envelope is binary."""
+    if binary:
+        audio_data = result["audio_bytes"]
+    else:
+        with stage_seconds.time(service, "encode"):
+            audio_data = base64.b64encode(result["audio_bytes"]).decode("ascii")
+    return {
+        "audio_data": audio_data,
+        "audio_format": result["audio_format"],
+        "duration_ms": result["duration_ms"],
+        "metadata": result.get("metadata"),
+    }
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
 
-@app.post("/api/v1/tts/synthesize", response_model=TTSResponse)
-async def synthesize(request: TTSRequest):
-    """Synthesize speech using Gemini or OpenAI."""
-    
-    if request.service == "gemini":
-        return await synthesize_gemini(
-            text=request.text,
-            voice=request.voice or "Kore",
-            language=request.language or "en-US",
-            audio_format=request.audio_format,
-            prompt=request.prompt,
-        )
-    
-    elif request.service == "openai":
-        return await synthesize_openai(
-            text=request.text,
-            voice=request.voice or "alloy",
-            language=request.language,
-            audio_format=request.audio_format,
-            speed=request.speed or 1.0,
-            instructions=request.instructions,
-        )
-    
-    else:
-        raise HTTPException(400, f"Unknown service: {request.service}")
+@app.post(
+    "/api/v1/tts/synthesize",
+    response_model=TTSResponse,
+    responses={200: {"content": {mt: {} for mt in sorted({*MEDIA_TYPES.values(), *serialization.ENCODERS})}}},
+)
+async def synthesize(
+    request: TTSRequest,
+    http_request: Request,
+    raw: bool = Query(False, description="Return raw audio bytes instead of base64 JSON"),
+    url: bool = Query(False, description="Store the audio and return audio_url instead of audio_data"),
+    accept: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None),
+):
+    """Synthesize speech using Gemini or OpenAI.
+
+    Returns base64 JSON by default, or the raw audio bytes with metadata in
+    X-Audio-* headers when `raw=true` or the Accept header prefers audio/*.
+    An Accept of application/msgpack or application/cbor returns the same
+    fields in that envelope, with `audio_data` as raw bytes.
+
+    With `url=true` (and AUDIO_STORE_ENABLED) the audio is stored and the
+    envelope carries `audio_url`, a stable link served by GET /api/v1/audio/{name}.
+
+    X-Request-Timeout (seconds) sets the deadline; past it the request fails
+    with 504, and upstream work stops as soon as the client disconnects.
+    """
+    timeout = _request_timeout(x_request_timeout)
+    with deadline(timeout):
+        result, headers = await _cancel_on_disconnect(http_request, _render(request), timeout)
+    service = headers.get("X-Provider", request.service)
+    if url:
+        return await _stored_response(result, headers, service, serialization.negotiate(accept), http_request)
+    return _respond(result, headers, service, "audio" if raw else serialization.negotiate(accept))
+
+
+@app.post(
+    "/api/v1/tts/document",
+    response_model=TTSResponse,
+    responses={200: {"content": {mt: {} for mt in sorted({*MEDIA_TYPES.values(), *serialization.ENCODERS})}}},
+)
+async def synthesize_document(
+    request: DocumentTTSRequest,
+    http_request: Request,
+    raw: bool = Query(False, description="Return raw audio bytes instead of base64 JSON"),
+    accept: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None),
+):
+    """Synthesize a long document by rendering provider-sized chunks concurrently.
+
+    Chunks are cached individually, so re-rendering an edited document only
+    synthesizes the chunks that changed. X-Chunks and X-Chunks-Cached report
+    how the document was split and how many chunks came from the cache. When
+    local transcoding is available, chunks are rendered as WAV, joined, and
+    encoded once, which yields a single continuous stream in every format.
+    Without X-Request-Timeout the deadline is REQUEST_TIMEOUT_MAX_SECONDS.
+    """
+    service = _resolve_service(request)
+    params = _provider_params(request, service)
+    audio_format = params["audio_format"]
+    if _transcodes(audio_format):
+        params["audio_format"] = CANONICAL_FORMAT
+    cache_hits = 0
+
+    async def render(chunk_params: dict) -> dict:
+        nonlocal cache_hits
+        result, headers = await _render_cached(service, chunk_params)
+        cache_hits += headers.get("X-Cache") == "HIT"
+        return result
+
+    async def render_all() -> dict:
+        max_bytes = await _max_input_bytes(service)
+        result = await render_document(params, render, max_bytes, LONGFORM_CONCURRENCY)
+        if result["audio_format"] != audio_format:
+            result = await _transcode_result(result, audio_format)
+        return result
+
+    timeout = _request_timeout(x_request_timeout, REQUEST_TIMEOUT_MAX_SECONDS)
+    with deadline(timeout):
+        result = await _cancel_on_disconnect(http_request, render_all(), timeout)
+    headers = {"X-Chunks": str(result["chunks"]), "X-Chunks-Cached": str(cache_hits), "X-Provider": service}
+    return _respond(result, headers, service, "audio" if raw else serialization.negotiate(accept))
+
+
+def _batch_item(index: int, status_code: int, result: Optional[dict] = None, error: Optional[str] = None) -> dict:
+    """Build one batch result with every BatchItemResult key, as the response model did."""
+    return {"index": index, "status_code": status_code, "result": result, "error": error}
+
+
+async def _render_batch_item(index: int, item: TTSRequest) -> dict:
+    """Render one batch item, turning failures into a per-item error instead of raising."""
+    try:
+        service = _resolve_service(item)
+        async with _batch_semaphores[service]:
+            # Items still queued when the batch deadline passes fail on their own
+            result, headers = await asyncio.wait_for(_render(item), remaining())
+        service = headers.get("X-Provider", service)
+        return _batch_item(index, 200, result=_envelope(result, service))
+    except HTTPException as e:
+        return _batch_item(index, e.status_code, error=str(e.detail))
+    except asyncio.TimeoutError:
+        return _batch_item(index, 504, error=DeadlineExceeded().detail)
+    except Exception as e:
+        return _batch_item(index, 500, error=str(e))
+
+
+@app.post(
+    "/api/v1/tts/batch",
+    response_model=BatchTTSResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def synthesize_batch(
+    request: BatchTTSRequest,
+    http_request: Request,
+    stream: bool = Query(False, description="Stream each result as NDJSON as soon as it completes"),
+    accept: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None),
+):
+    """Synthesize many items concurrently under per-provider concurrency limits.
+
+    Returns all results in input order, each with its own status code. With
+    `stream=true` or `Accept: application/x-ndjson`, each result is written as
+    one JSON line in completion order instead; its `index` maps it back.
+
+    Items unfinished at the deadline (X-Request-Timeout, by default
+    REQUEST_TIMEOUT_MAX_SECONDS) report 504; a disconnect cancels the rest.
+    """
+    with deadline(_request_timeout(x_request_timeout, REQUEST_TIMEOUT_MAX_SECONDS)):
+        tasks = [asyncio.create_task(_render_batch_item(i, item)) for i, item in enumerate(request.items)]
+
+    if not (stream or (accept or "").startswith("application/x-ndjson")):
+        results = await _cancel_on_disconnect(http_request, asyncio.gather(*tasks))
+        body = serialization.dumps_json({"results": results})
+        return Response(body, media_type=serialization.JSON)
+
+    async def lines():
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield serialization.dumps_json(await next_done) + b"\n"
+        finally:
+            # Stop rendering if the client goes away before the batch finishes
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """A StreamingResponse that always awaits on_close, even if its body was never iterated."""
+
+    def __init__(self, content, on_close: Callable[[], Awaitable[None]], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
+
+
+@app.post("/api/v1/tts/stream")
+async def stream(
+    request: TTSRequest,
+    http_request: Request,
+    x_request_timeout: Optional[str] = Header(None),
+):
+    """Stream synthesized audio as chunked bytes while the provider produces it.
+
+    The deadline (X-Request-Timeout) bounds the wait for the upstream stream to
+    open; after that, the client disconnecting stops the upstream stream.
+    """
+    service = _resolve_service(request)
+    params = _provider_params(request, service)
+
+    async def open_stream():
+        try:
+            provider = await services.get_provider(service)
+            return await provider.stream(**params)
+        except (Overloaded, DeadlineExceeded):
+            raise
+        except asyncio.CancelledError:
+            upstream_calls.inc(service, "cancelled")
+            raise
+        except BaseException:
+            upstream_calls.inc(service, "failed")
+            raise
+
+    start = time.perf_counter()
+    request_bytes.observe(text_size(params["text"]), service)
+    upstream_in_flight.inc(service)
+    timeout = _request_timeout(x_request_timeout)
+    try:
+        with deadline(timeout):
+            chunks = await _cancel_on_disconnect(http_request, open_stream(), timeout)
+    except BaseException:
+        upstream_in_flight.dec(service)
+        raise
+    upstream_ms = (time.perf_counter() - start) * 1000
+
+    sent = 0
+    outcome = "cancelled"
+    closed = False
+
+    async def close():
+        # Runs once, from the body or, if the body never started, from the response
+        nonlocal closed
+        if closed:
+            return
+        closed = True
+        try:
+            await chunks.aclose()
+        finally:
+            upstream_calls.inc(service, outcome)
+            upstream_in_flight.dec(service)
+            response_bytes.observe(sent, service)
+
+    async def body():
+        nonlocal sent, outcome
+        first = True
+        try:
+            async for chunk in chunks:
+                if first:
+                    first = False
+                    ttfb_ms = (time.perf_counter() - start) * 1000
+                    logger.info("stream %s first byte after %.1f ms", service, ttfb_ms)
+                sent += len(chunk)
+                yield chunk
+            outcome = "completed"
+        except Exception:
+            outcome = "failed"
+            raise
+        finally:
+            await close()
+
+    return _ClosingStreamingResponse(
+        body(),
+        close,
+        media_type=media_type(request.audio_format),
+        headers={"Server-Timing": f"upstream;dur={upstream_ms:.1f}", "X-Provider": service},
+    )
+
+
+@app.websocket("/api/v1/tts/ws")
+async def synthesize_incremental(websocket: WebSocket):
+    """Synthesize text that arrives in pieces, such as tokens from a language model.
+
+    The client sends {"type": "start", ...} with the TTSRequest fields other than
+    `text`, then {"type": "text", "text": delta} messages. Deltas are buffered up to
+    sentence or clause boundaries; each completed segment is synthesized (up to
+    WS_PREFETCH ahead) and sent in order as a {"type": "segment", ...} message
+    followed by one binary message with that segment's audio.
+
+    {"type": "flush"} speaks whatever is buffered now, {"type": "cancel"} drops
+    buffered and pending segments, and {"type": "end"} speaks the rest, sends
+    {"type": "done"} and closes. Failures are reported as {"type": "error", ...}.
+    """
+    await websocket.accept()
+    try:
+        start = json.loads(await websocket.receive_text())
+        if not isinstance(start, dict) or start.get("type") != "start":
+            raise ValueError('The first message must be {"type": "start", ...}')
+        template = TTSRequest.model_validate({**start, "text": "."})
+        service = _resolve_service(template)
+        max_bytes = await _max_input_bytes(service)
+    except WebSocketDisconnect:
+        return
+    except (ValueError, HTTPException) as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        await websocket.send_json({"type": "error", "detail": detail})
+        await websocket.close(code=1008)
+        return
+
+    buffer = SentenceBuffer(max_bytes, clause_bytes=WS_CLAUSE_BYTES)
+    outbox: asyncio.Queue = asyncio.Queue(maxsize=WS_MAX_QUEUED_SEGMENTS)
+    rendering = asyncio.Semaphore(WS_PREFETCH)
+    pending: set[asyncio.Task] = set()
+    next_index = 0
+    # Bumped by "cancel"; segments queued under an older epoch are dropped unsent
+    epoch = 0
+
+    async def render(segment: str) -> dict:
+        async with rendering:
+            request = template.model_copy(update={"text": segment})
+            result, _ = await _render_cached(service, _provider_params(request, service))
+            return result
+
+    async def send_loop() -> None:
+        while True:
+            item = await outbox.get()
+            if item is None:
+                return
+            if isinstance(item, dict):
+                await websocket.send_json(item)
+                continue
+            item_epoch, index, segment, task = item
+            await asyncio.wait([task])
+            if item_epoch != epoch or task.cancelled():
+                continue
+            try:
+                result = task.result()
+            except HTTPException as e:
+                await websocket.send_json(
+                    {"type": "error", "index": index, "status_code": e.status_code, "detail": e.detail}
+                )
+                continue
+            except Exception as e:
+                await websocket.send_json({"type": "error", "index": index, "status_code": 500, "detail": str(e)})
+                continue
+            await websocket.send_json({
+                "type": "segment",
+                "index": index,
+                "text": segment,
+                "audio_format": result["audio_format"],
+                "duration_ms": result["duration_ms"],
+                "bytes": len(result["audio_bytes"]),
+            })
+            await websocket.send_bytes(result["audio_bytes"])
+            response_bytes.observe(len(result["audio_bytes"]), service)
+
+    sender = asyncio.create_task(send_loop())
+
+    async def post(item) -> None:
+        # Wait for room in the outbox, unless the sender has stopped (the socket closed)
+        put = asyncio.ensure_future(outbox.put(item))
+        await asyncio.wait({put, sender}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            raise WebSocketDisconnect(1006)
+
+    async def enqueue(segments: list[str]) -> None:
+        nonlocal next_index
+        for segment in segments:
+            task = asyncio.create_task(render(segment))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            await post((epoch, next_index, segment, task))
+            next_index += 1
+
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                kind = message.get("type")
+            except (ValueError, AttributeError):
+                await post({"type": "error", "detail": "Messages must be JSON objects with a type"})
+                continue
+            if kind == "text":
+                await enqueue(buffer.feed(str(message.get("text", ""))))
+            elif kind == "flush":
+                await enqueue(buffer.flush())
+            elif kind == "cancel":
+                epoch += 1
+                buffer.clear()
+                for task in list(pending):
+                    task.cancel()
+                await post({"type": "cancelled"})
+            elif kind == "end":
+                await enqueue(buffer.flush())
+                await post({"type": "done"})
+                await post(None)
+                await sender
+                await websocket.close()
+                return
+            else:
+                await post({"type": "error", "detail": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        for task in list(pending):
+            task.cancel()
+
+
+@app.get(
+    "/api/v1/audio/{name}",
+    responses={200: {"content": {mt: {} for mt in sorted(set(MEDIA_TYPES.values()))}}, 206: {}, 304: {}, 416: {}},
+)
+@app.head("/api/v1/audio/{name}", include_in_schema=False)
+async def get_audio(name: str, request: Request):
+    """Serve stored audio with a strong ETag, If-None-Match revalidation and byte ranges.
+
+    Names are content hashes, so responses are cacheable forever. Range requests
+    let players seek and resume; /index maps time offsets to byte offsets.
+    """
+    if audio_store is None:
+        raise HTTPException(404, "Audio store disabled. Set AUDIO_STORE_ENABLED=true in .env")
+    path = await asyncio.to_thread(audio_store.locate, name)
+    if path is None:
+        raise HTTPException(404, "Audio not found or expired")
+    return AudioFileResponse(path, name, request.headers, AUDIO_STORE_ACCEL_REDIRECT)
+
+
+@app.get("/api/v1/audio/{name}/index")
+async def get_audio_index(name: str):
+    """Return the duration and [time_ms, byte_offset] seek points of stored MP3 or WAV audio."""
+    index = await asyncio.to_thread(audio_store.index, name) if audio_store is not None else None
+    if index is None:
+        raise HTTPException(404, "No seek index for this audio")
+    return index
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Expose per-stage latency histograms, byte sizes, in-flight calls and upstream errors."""
+    if not METRICS_ENABLED:
+        raise HTTPException(404, "Metrics are disabled. Set METRICS_ENABLED=true in .env")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/v1/admin/cache", dependencies=[Depends(require_admin)])
+async def cache_stats():
+    """Report audio cache hit/miss counters and tier sizes."""
+    if audio_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **audio_cache.stats()}
+
+
+@app.get("/api/v1/admin/coalescing", dependencies=[Depends(require_admin)])
+async def coalescing_stats():
+    """Report in-flight upstream calls and how many requests joined an existing one."""
+    return in_flight.stats()
+
+
+@app.get("/api/v1/admin/routing", dependencies=[Depends(require_admin)])
+async def routing_stats():
+    """Report per-provider latency, error rate and circuit breaker state."""
+    return router.stats()
+
+
+@app.get("/api/v1/admin/upstream", dependencies=[Depends(require_admin)])
+async def upstream_stats():
+    """Report upstream rate limits, queue depth, wait times, shed requests and retries."""
+    return services.stats()
+
+
+@app.get("/api/v1/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """List saved request profiles with their request metadata, newest first."""
+    return {"profiles": await asyncio.to_thread(profile_store.list)}
+
+
+@app.get("/api/v1/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile(profile_id: str):
+    """Download a profile as collapsed stacks, for flamegraph.pl or speedscope."""
+    path = await asyncio.to_thread(profile_store.path, profile_id)
+    if path is None:
+        raise HTTPException(404, "Profile not found")
+    return Response(
+        await asyncio.to_thread(path.read_bytes),
+        media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'},
+    )
+
+
+@app.delete("/api/v1/admin/cache", dependencies=[Depends(require_admin)])
+async def purge_cache():
+    """Remove every cached audio entry from both tiers."""
+    if audio_cache is None:
+        return {"enabled": False}
+    await audio_cache.purge()
+    return {"enabled": True, **audio_cache.stats()}
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host=HOST, port=PORT, reload=DEBUG)
+    # An import string, so uvicorn can start WORKERS processes (and reload in DEBUG)
+    uvicorn.run("main:app", host=HOST, port=PORT, reload=DEBUG, workers=WORKERS)
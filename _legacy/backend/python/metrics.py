@@ -0,0 +1,180 @@
+"""Low-overhead Prometheus metrics for the synthesis path.
+
+Metrics are plain counters updated from the event loop, with no locking or
+label validation on the hot path, and rendered in the Prometheus text format
+only when scraped.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator, Sequence
+
+from config import METRICS_ENABLED
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a cached token lookup up to a slow long-form render
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Bytes, from a short phrase up to several minutes of audio
+SIZE_BUCKETS = tuple(float(4 ** n * 64) for n in range(10))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        if METRICS_ENABLED:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {_number(value)}"
+
+
+class Gauge(Counter):
+    """Value per label set that can go up and down."""
+
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    """Bucketed distribution with a sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observe the duration of the enclosed block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self) -> Iterator[str]:
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+stage_seconds = Histogram(
+    "tts_stage_duration_seconds",
+    "Time spent in each stage of synthesis: credential, queue, connect, upstream "
+    "(request sent to response headers), download, encode (base64) and serialize.",
+    ("service", "stage"),
+)
+request_bytes = Histogram(
+    "tts_request_bytes",
+    "UTF-8 size of the text sent to the provider per upstream call.",
+    ("service",),
+    SIZE_BUCKETS,
+)
+response_bytes = Histogram(
+    "tts_response_bytes",
+    "Size of the response body sent to the client.",
+    ("service",),
+    SIZE_BUCKETS,
+)
+upstream_in_flight = Gauge(
+    "tts_upstream_in_flight",
+    "Upstream synthesis calls currently in progress.",
+    ("service",),
+)
+upstream_errors = Counter(
+    "tts_upstream_errors_total",
+    "Failed upstream calls, including retried attempts, by HTTP status code.",
+    ("service", "status"),
+)
+
+upstream_calls = Counter(
+    "tts_upstream_calls_total",
+    "Upstream synthesis calls by outcome: completed, failed, or cancelled (client disconnected, "
+    "deadline passed or hedge lost).",
+    ("service", "outcome"),
+)
+requests_abandoned = Counter(
+    "tts_requests_abandoned_total",
+    "Requests whose work was cancelled, by reason: disconnect or deadline.",
+    ("reason",),
+)
+phrase_chars = Counter(
+    "tts_phrase_chars_total",
+    "Characters of sentences looked up in phrase-cache mode, by outcome: hit, coalesced or miss "
+    "(only misses are sent upstream).",
+    ("service", "outcome"),
+)
+
+REGISTRY = (
+    stage_seconds, request_bytes, response_bytes, upstream_in_flight, upstream_errors,
+    upstream_calls, requests_abandoned, phrase_chars,
+)
+
+
+def render() -> str:
+    """Render every metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
@@ -0,0 +1,189 @@
+"""Content-addressed audio object store, served by URL with ETag and byte-range support.
+
+Objects are named by the SHA-256 of their bytes plus the format extension, so a
+URL always refers to the same audio and can be cached forever by clients. Each
+MP3 or WAV object has a seek index next to it, mapping time offsets to byte
+offsets that a client can request with a Range header.
+"""
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from audio import media_type, seek_index
+from cache import FileIndex
+
+# Object names: hex SHA-256 of the audio, then its format
+_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+
+# Bytes read per chunk when the server cannot send the file itself
+_READ_CHUNK_BYTES = 256 * 1024
+
+
+class AudioStore(FileIndex):
+    """Plain audio files named by content, served as-is under a byte budget.
+
+    Objects expire by time since last access, so a stored URL stays valid for as
+    long as it keeps being fetched.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, ttl_seconds: float, index_interval_ms: int = 1000):
+        self.index_interval_ms = index_interval_ms
+        super().__init__(directory, max_bytes, ttl_seconds)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _index_path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.index.json"
+
+    def _scan(self, db) -> None:
+        for path in self.directory.glob("*/*"):
+            if _NAME.match(path.name):
+                stat = path.stat()
+                db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (path.name, stat.st_size, stat.st_mtime))
+
+    def _remove(self, db, keys: list[str]) -> None:
+        super()._remove(db, keys)
+        for key in keys:
+            try:
+                self._index_path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def put(self, audio_bytes: bytes, audio_format: str) -> str:
+        """Store audio unless an identical object exists, and return its name."""
+        key = f"{hashlib.sha256(audio_bytes).hexdigest()}.{audio_format}"
+        if not self._path(key).exists():
+            index = seek_index(audio_bytes, audio_format, self.index_interval_ms)
+            if index is not None:
+                duration_ms, points = index
+                self._write(self._index_path(key), json.dumps({
+                    "duration_ms": duration_ms,
+                    "interval_ms": self.index_interval_ms,
+                    "points": points,
+                }).encode("utf-8"))
+            self._write(self._path(key), audio_bytes)
+        self._record(key, len(audio_bytes))
+        return key
+
+    def locate(self, key: str) -> Optional[Path]:
+        """Return the file for an object name and mark it used, or None if it is unknown."""
+        if not _NAME.match(key) or not self._touch(key):
+            return None
+        path = self._path(key)
+        return path if path.exists() else None
+
+    def index(self, key: str) -> Optional[dict]:
+        """Return the seek index of an object, or None if it has none."""
+        if not _NAME.match(key):
+            return None
+        try:
+            return json.loads(self._index_path(key).read_bytes())
+        except FileNotFoundError:
+            return None
+
+
+def _parse_range(value: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=" range into inclusive (start, end) offsets.
+
+    Returns None when the range cannot be satisfied, and (0, size - 1) for forms
+    that are served whole instead (other units, several ranges, bad syntax).
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return 0, size - 1
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return 0, size - 1
+    if start > end or start >= size:
+        return None
+    return start, min(end, size - 1)
+
+
+class AudioFileResponse(Response):
+    """Serve a stored object with a strong ETag, If-None-Match and single byte ranges.
+
+    The file is handed to the server with the ASGI zero-copy send extension when it
+    offers one, or to a fronting nginx with X-Accel-Redirect when `accel_redirect`
+    names its internal location for the store directory; otherwise it is read in
+    chunks off the event loop.
+    """
+
+    def __init__(self, path: Path, key: str, request_headers: Headers, accel_redirect: Optional[str] = None,
+                 headers: Optional[dict] = None):
+        size = path.stat().st_size
+        etag = f'"{key.partition(".")[0]}"'
+        self.path = path
+        self.offset, self.count = 0, size
+        self.accel_redirect = accel_redirect
+        status_code = 200
+        response_headers = {
+            "ETag": etag,
+            "Accept-Ranges": "bytes",
+            # Names are content hashes, so an object never changes
+            "Cache-Control": "public, max-age=31536000, immutable",
+            **(headers or {}),
+        }
+        if_none_match = request_headers.get("if-none-match")
+        byte_range = request_headers.get("range")
+        if if_none_match and (if_none_match.strip() == "*" or
+                              etag in (t.strip().removeprefix("W/") for t in if_none_match.split(","))):
+            status_code, self.count = 304, 0
+        elif byte_range and request_headers.get("if-range", etag) == etag and size > 0:
+            parsed = _parse_range(byte_range, size)
+            if parsed is None:
+                status_code, self.count = 416, 0
+                response_headers["Content-Range"] = f"bytes */{size}"
+            elif parsed != (0, size - 1):
+                status_code = 206
+                self.offset, self.count = parsed[0], parsed[1] - parsed[0] + 1
+                response_headers["Content-Range"] = f"bytes {parsed[0]}-{parsed[1]}/{size}"
+        if status_code != 304:
+            response_headers["Content-Length"] = str(self.count)
+        if accel_redirect is not None and status_code in (200, 206):
+            # nginx serves the file (and the range) itself; our headers describe it
+            response_headers["X-Accel-Redirect"] = f"{accel_redirect.rstrip('/')}/{key[:2]}/{key}"
+            del response_headers["Content-Length"]
+            if status_code == 206:
+                status_code = 200
+                del response_headers["Content-Range"]
+        super().__init__(status_code=status_code, headers=response_headers, media_type=media_type(key.rpartition(".")[2]))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.count == 0 or scope["method"] == "HEAD" or self.accel_redirect is not None:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": self.offset,
+                            "count": self.count})
+            return
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await f.read(min(_READ_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # The file shrank underneath us; end the body rather than hang the client
+                await send({"type": "http.response.body", "body": b""})
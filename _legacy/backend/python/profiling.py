@@ -0,0 +1,272 @@
+"""Opt-in sampling profiler for individual synthesis requests.
+
+A request is profiled when it carries X-Profile: true with a valid X-Admin-Token,
+or when it is picked at random at PROFILE_SAMPLE_RATE. While it runs, a thread
+samples every PROFILE_INTERVAL_MS:
+    - the event loop's stack, when one of the request's tasks is running, and
+    - the await chain of each of its suspended tasks, ending in what it waits on
+      (an upstream response, a queue, a worker thread), marked "[await ...]".
+The request's tasks are the one serving it and every task started under it.
+Counts are per task, so concurrent tasks of one request add up beyond its wall
+time. Profiles are written as collapsed stacks, ready for flamegraph.pl or
+speedscope, with a JSON file of request metadata next to them.
+
+Nothing is installed while no request is being profiled; other requests only
+pay for a header lookup and, with a sample rate, one random number.
+"""
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Profile of the request the current task belongs to, inherited by the tasks it starts
+_active: ContextVar[Optional["Profile"]] = ContextVar("profile", default=None)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def _await_chain(task: asyncio.Task) -> list[str]:
+    """Return the frames a suspended task is awaiting through, outermost first."""
+    names = []
+    awaited = task.get_coro()
+    while awaited is not None:
+        frame = getattr(awaited, "cr_frame", None) or getattr(awaited, "ag_frame", None) or \
+            getattr(awaited, "gi_frame", None)
+        if frame is None:
+            names.append(f"[await {type(awaited).__name__}]")
+            break
+        names.append(_frame_name(frame))
+        awaited = getattr(awaited, "cr_await", None) or getattr(awaited, "ag_await", None) or \
+            getattr(awaited, "gi_yieldfrom", None)
+    return names
+
+
+class Profile:
+    """Collapsed stacks sampled from one request's tasks."""
+
+    def __init__(self, trigger: str, loop: asyncio.AbstractEventLoop):
+        self.id = uuid.uuid4().hex[:16]
+        self.trigger = trigger
+        self.loop = loop
+        self.thread_id = threading.get_ident()
+        self.tasks: set[asyncio.Task] = set()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = time.time()
+
+    def track(self, task: asyncio.Task) -> None:
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def sample(self) -> None:
+        """Record one sample of every task; called from the sampler thread."""
+        self.samples += 1
+        running = asyncio.current_task(self.loop)
+        for task in list(self.tasks):
+            try:
+                if task is running:
+                    stack = self._running_stack(task)
+                elif not task.done():
+                    stack = _await_chain(task)
+                else:
+                    continue
+            except Exception:
+                # The task moved on while we were reading it; skip this sample
+                continue
+            if stack:
+                self.stacks[";".join(stack)] += 1
+
+    def _running_stack(self, task: asyncio.Task) -> list[str]:
+        frame = sys._current_frames().get(self.thread_id)
+        root = getattr(task.get_coro(), "cr_frame", None)
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            if frame is root:
+                # Leave out the event loop frames below the task's coroutine
+                break
+            frame = frame.f_back
+        return [_frame_name(f) for f in reversed(frames)]
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Sampler:
+    """One thread sampling every active profile, running only while there are any."""
+
+    def __init__(self, interval_ms: float):
+        self.interval = interval_ms / 1000
+        self._profiles: set[Profile] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._previous_factory = None
+
+    def start(self, profile: Profile) -> None:
+        """Start sampling a profile; called on the event loop thread."""
+        if not any(p.loop is profile.loop for p in self._profiles):
+            # Tasks created under the request join its profile
+            self._previous_factory = profile.loop.get_task_factory()
+            profile.loop.set_task_factory(self._task_factory)
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles.discard(profile)
+        if not any(p.loop is profile.loop for p in self._profiles):
+            profile.loop.set_task_factory(self._previous_factory)
+            self._previous_factory = None
+
+    def _task_factory(self, loop, coro, **kwargs) -> asyncio.Future:
+        task: asyncio.Future
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        profile = _active.get()
+        # Factories may return any future; only tasks have stacks to sample
+        if profile is not None and isinstance(task, asyncio.Task):
+            profile.track(task)
+        return task
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                profiles = list(self._profiles)
+                if not profiles:
+                    self._thread = None
+                    return
+            for profile in profiles:
+                profile.sample()
+            time.sleep(self.interval)
+
+
+class ProfileStore:
+    """Profiles on disk as <id>.folded with <id>.json metadata, newest max_files kept."""
+
+    def __init__(self, directory: Path, max_files: int):
+        self.directory = Path(directory)
+        self.max_files = max_files
+
+    def save(self, profile: Profile, metadata: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{profile.id}.folded").write_text(profile.collapsed())
+        (self.directory / f"{profile.id}.json").write_text(json.dumps(metadata))
+        for old in self._metadata_files()[self.max_files:]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".folded").unlink(missing_ok=True)
+
+    def _metadata_files(self) -> list[Path]:
+        """Metadata files, newest first."""
+        files = []
+        for path in self.directory.glob("*.json"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                pass
+        return [path for _, path in sorted(files, reverse=True)]
+
+    def list(self) -> list[dict]:
+        profiles = []
+        for path in self._metadata_files():
+            try:
+                profiles.append(json.loads(path.read_text()))
+            except (FileNotFoundError, ValueError):
+                pass
+        return profiles
+
+    def path(self, profile_id: str) -> Optional[Path]:
+        """Return the collapsed stacks file of a profile, or None if it is unknown."""
+        if not profile_id.isalnum():
+            return None
+        path = self.directory / f"{profile_id}.folded"
+        return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    """Profile selected requests under path_prefix and save them to the store.
+
+    The response carries X-Profile-Id, the name to download the profile by.
+    """
+
+    def __init__(self, app: ASGIApp, store: ProfileStore, admin_token: Optional[str], sample_rate: float,
+                 interval_ms: float, path_prefix: str = "/api/v1/tts/"):
+        self.app = app
+        self.store = store
+        self.admin_token = admin_token
+        self.sample_rate = sample_rate
+        self.path_prefix = path_prefix
+        self.sampler = Sampler(interval_ms)
+
+    def _trigger(self, scope: Scope) -> Optional[str]:
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            return None
+        headers = Headers(scope=scope)
+        if self.admin_token and headers.get("x-profile", "").lower() == "true" and \
+                headers.get("x-admin-token") == self.admin_token:
+            return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(trigger, asyncio.get_running_loop())
+        status_code = None
+        headers = Headers(scope=scope)
+
+        async def send_with_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile-id", profile.id.encode("latin-1"))]}
+            await send(message)
+
+        token = _active.set(profile)
+        current = asyncio.current_task()
+        if current is not None:
+            profile.track(current)
+        self.sampler.start(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.sampler.stop(profile)
+            _active.reset(token)
+            metadata = {
+                "id": profile.id,
+                "trigger": trigger,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "user_agent": headers.get("user-agent"),
+                "status_code": status_code,
+                "started_at": profile.started_at,
+                "duration_ms": round(elapsed_ms, 1),
+                "samples": profile.samples,
+                "interval_ms": self.sampler.interval * 1000,
+            }
+            await asyncio.to_thread(self.store.save, profile, metadata)
@@ -0,0 +1,136 @@
+"""Latency-aware provider selection with circuit breaking for `service: "auto"`."""
+import time
+from collections import deque
+from typing import Optional
+
+# Upstream statuses that count against a provider's health; other 4xx are caller errors
+_FAILURE_STATUSES = {408, 429}
+
+
+def is_provider_failure(status_code: int) -> bool:
+    """Return True if an error status means the provider, not the request, is at fault."""
+    return status_code >= 500 or status_code in _FAILURE_STATUSES
+
+
+class ProviderHealth:
+    """EWMA latency and error rate plus a circuit breaker for one provider."""
+
+    def __init__(self, alpha: float, window: int, failure_threshold: int, reset_seconds: float):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self._recent: deque[float] = deque(maxlen=window)
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._probing = False
+
+    def record(self, latency_ms: float, ok: bool) -> None:
+        self.requests += 1
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        self._probing = False
+        if ok:
+            self._recent.append(latency_ms)
+            self.latency_ms = latency_ms if self.latency_ms is None else (
+                self.latency_ms + self.alpha * (latency_ms - self.latency_ms)
+            )
+            self._consecutive_failures = 0
+            self._open_until = 0.0
+            return
+        self.failures += 1
+        self._consecutive_failures += 1
+        if self._consecutive_failures >= self.failure_threshold:
+            self._open_until = time.monotonic() + self.reset_seconds
+
+    @property
+    def state(self) -> str:
+        if not self._open_until:
+            return "closed"
+        return "open" if time.monotonic() < self._open_until else "half-open"
+
+    @property
+    def samples(self) -> int:
+        return len(self._recent)
+
+    def available(self) -> bool:
+        """Return True if a request may be sent; a half-open circuit admits one probe at a time."""
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self._probing)
+
+    def begin(self) -> None:
+        """Note that a request is being sent, claiming the probe slot of a half-open circuit."""
+        if self.state == "half-open":
+            self._probing = True
+
+    def abandon(self) -> None:
+        """Release the probe slot of a request that was cancelled before it finished."""
+        self._probing = False
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "latency_ewma_ms": self.latency_ms,
+            "latency_p95_ms": self.percentile(0.95),
+            "error_rate_ewma": self.error_rate,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class Router:
+    """Rank providers by health and latency and decide when to hedge."""
+
+    def __init__(self, providers: tuple[str, ...], alpha: float = 0.2, window: int = 200,
+                 failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 hedge_min_samples: int = 20, hedge_default_delay: float = 2.0):
+        self.health = {
+            name: ProviderHealth(alpha, window, failure_threshold, reset_seconds) for name in providers
+        }
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay = hedge_default_delay
+        self.hedges = 0
+
+    def begin(self, provider: str) -> None:
+        self.health[provider].begin()
+
+    def abandon(self, provider: str) -> None:
+        self.health[provider].abandon()
+
+    def record(self, provider: str, latency_ms: float, ok: bool) -> None:
+        self.health[provider].record(latency_ms, ok)
+
+    def _score(self, provider: str) -> float:
+        health = self.health[provider]
+        if health.latency_ms is None:
+            # Untried providers score 0 so they get explored; never-successful ones go last
+            return float("inf") if health.failures else 0.0
+        # Errors inflate the effective latency
+        return health.latency_ms * (1.0 + 4.0 * health.error_rate)
+
+    def ranked(self) -> list[str]:
+        """Return providers that may take a request now, fastest healthy one first."""
+        # Closed circuits first, then half-open ones waiting for a probe
+        ordered = sorted(self.health, key=lambda name: (self.health[name].state != "closed", self._score(name)))
+        return [name for name in ordered if self.health[name].available()]
+
+    def hedge_delay(self, provider: str) -> float:
+        """Seconds to wait on provider before hedging: its p95 latency once enough samples exist."""
+        health = self.health[provider]
+        if health.samples < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return (health.percentile(0.95) or 0.0) / 1000
+
+    def stats(self) -> dict:
+        return {
+            "hedged_requests": self.hedges,
+            "providers": {name: health.stats() for name, health in self.health.items()},
+        }
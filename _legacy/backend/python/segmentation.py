@@ -0,0 +1,161 @@
+"""Text segmentation helpers for incremental and long-document synthesis.
+
+Limits are measured in UTF-8 bytes, which is how the upstream APIs count input size.
+"""
+import re
+import unicodedata
+from typing import Optional
+
+# A sentence runs up to terminal punctuation, plus any closing quotes/brackets, before whitespace
+_SENTENCE = re.compile(r"\S.*?(?:[.!?…。！？]+[\"'”’)\]]*(?=\s|$)|$)", re.S)
+
+# Common abbreviations whose trailing period does not end a sentence
+_ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "prof.", "st.", "vs.", "etc.", "e.g.", "i.e.", "no."}
+
+# Clause boundaries used to break up sentences that are still too long
+_CLAUSE_END = re.compile(r"(?<=[,;:—])\s+")
+
+# Paragraphs are separated by one or more blank lines
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+# Typographic variants that are spoken the same, and invisible characters
+_FOLD = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "\u200b": None, "\u2060": None, "\ufeff": None})
+
+# Spaces before closing punctuation, and a missing space after a comma, semicolon,
+# ! or ?, or after a full stop that ends a word and precedes a capital
+_SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+(?=[,.;:!?…)\]])")
+_NO_SPACE_AFTER_PUNCTUATION = re.compile(r"(?<=[,;!?])(?=[^\W\d_])|(?<=[a-z]{2}\.)(?=[A-Z])")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def text_size(text: str) -> int:
+    """Return the size of text in UTF-8 bytes."""
+    return len(text.encode("utf-8"))
+
+
+def normalize_text(text: str) -> str:
+    """Canonicalize text that is spoken identically, so equal sentences share cache entries.
+
+    Applies Unicode NFC, folds curly quotes, drops zero-width characters, fixes
+    spacing around punctuation and collapses all whitespace (including line
+    breaks) to single spaces.
+    """
+    text = unicodedata.normalize("NFC", text).translate(_FOLD)
+    text = _SPACE_BEFORE_PUNCTUATION.sub("", text)
+    text = _NO_SPACE_AFTER_PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _split_long(sentence: str, max_bytes: int) -> list[str]:
+    """Break an over-long sentence at clause boundaries, then at whitespace."""
+    parts: list[str] = []
+    current = ""
+    for clause in _CLAUSE_END.split(sentence):
+        candidate = f"{current} {clause}" if current else clause
+        if text_size(candidate) <= max_bytes:
+            current = candidate
+            continue
+        if current:
+            parts.append(current)
+        # A single clause can still exceed the limit; fall back to word boundaries
+        while text_size(clause) > max_bytes:
+            limit = len(clause.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore"))
+            cut = clause.rfind(" ", 0, limit)
+            if cut <= 0:
+                cut = limit
+            parts.append(clause[:cut].rstrip())
+            clause = clause[cut:].lstrip()
+        current = clause
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_sentences(text: str, max_bytes: Optional[int] = None) -> list[str]:
+    """Split text into sentences, keeping each one within max_bytes when given."""
+    sentences: list[str] = []
+    for match in _SENTENCE.finditer(text):
+        sentence = match.group().strip()
+        if sentences and sentences[-1].rsplit(None, 1)[-1].lower() in _ABBREVIATIONS:
+            sentences[-1] = f"{sentences[-1]} {sentence}"
+        else:
+            sentences.append(sentence)
+    if max_bytes is None:
+        return sentences
+    result: list[str] = []
+    for sentence in sentences:
+        if text_size(sentence) <= max_bytes:
+            result.append(sentence)
+        else:
+            result.extend(_split_long(sentence, max_bytes))
+    return result
+
+
+def chunk_text(text: str, max_bytes: int) -> list[str]:
+    """Pack sentences into chunks of at most max_bytes, starting a new chunk at each paragraph."""
+    chunks: list[str] = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        current = ""
+        for sentence in split_sentences(paragraph, max_bytes):
+            candidate = f"{current} {sentence}" if current else sentence
+            if text_size(candidate) <= max_bytes:
+                current = candidate
+            else:
+                chunks.append(current)
+                current = sentence
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+class SentenceBuffer:
+    """Accumulate streamed text deltas and release them as sentence-sized segments.
+
+    A sentence is released once whitespace follows its terminal punctuation, so a
+    later delta that continues it ("3." then "14") is never cut off. Text without a
+    sentence end is released at its last clause boundary once it grows past
+    `clause_bytes`, and at word boundaries past `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int, clause_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.clause_bytes = clause_bytes
+        self._text = ""
+
+    def __len__(self) -> int:
+        return len(self._text)
+
+    def feed(self, delta: str) -> list[str]:
+        """Add a delta and return the segments it completed, in order."""
+        self._text += delta
+        segments: list[str] = []
+        boundary = 0
+        for match in _SENTENCE.finditer(self._text):
+            # A match that ends before the end of the buffer is followed by whitespace
+            if match.end() == len(self._text):
+                break
+            if match.group().rsplit(None, 1)[-1].lower() in _ABBREVIATIONS:
+                continue
+            boundary = match.end()
+        if boundary:
+            segments.extend(split_sentences(self._text[:boundary], self.max_bytes))
+            self._text = self._text[boundary:].lstrip()
+        if self.clause_bytes is not None and text_size(self._text) > self.clause_bytes:
+            clauses = list(_CLAUSE_END.finditer(self._text))
+            if clauses:
+                cut = clauses[-1].start()
+                segments.extend(split_sentences(self._text[:cut], self.max_bytes))
+                self._text = self._text[clauses[-1].end():]
+        if text_size(self._text) > self.max_bytes:
+            *complete, self._text = _split_long(self._text, self.max_bytes)
+            segments.extend(complete)
+        return segments
+
+    def flush(self) -> list[str]:
+        """Return whatever is buffered as segments, complete sentence or not, and clear it."""
+        segments = split_sentences(self._text, self.max_bytes)
+        self._text = ""
+        return segments
+
+    def clear(self) -> None:
+        self._text = ""
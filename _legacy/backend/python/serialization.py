@@ -0,0 +1,113 @@
+"""Response envelopes: fast JSON and optional MessagePack / CBOR encodings.
+
+Results are serialized directly from plain dicts, without building or validating
+a pydantic model around the multi-megabyte audio payload. orjson, msgpack and
+cbor2 are optional; JSON falls back to the standard library and the binary
+envelopes are only offered when their package is installed.
+"""
+import base64
+import json
+from typing import Any, Callable, Iterator, Optional, Tuple, cast
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+
+# Audio bytes base64-encoded per streamed chunk; a multiple of 3, so only the last chunk is padded
+STREAM_CHUNK_BYTES = 3 * 64 * 1024
+
+# Accept types that name the same envelope
+_ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK}
+
+
+def dumps_json(payload: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def stream_json(audio: bytes, fields: dict) -> Tuple[int, Iterator[bytes]]:
+    """Serialize {"audio_data": base64(audio), **fields} as JSON, a chunk at a time.
+
+    Returns the body length and an iterator over its chunks, which are identical
+    to dumps_json's output. Only one chunk of base64 exists at any time, instead
+    of the whole base64 string plus the whole body.
+    """
+    head = b'{"audio_data":"'
+    tail = b'",' + dumps_json(fields)[1:] if fields else b'"}'
+    size = len(head) + (len(audio) + 2) // 3 * 4 + len(tail)
+
+    def chunks() -> Iterator[bytes]:
+        yield head
+        view = memoryview(audio)
+        for offset in range(0, len(audio), STREAM_CHUNK_BYTES):
+            yield base64.b64encode(view[offset:offset + STREAM_CHUNK_BYTES])
+        yield tail
+
+    return size, chunks()
+
+
+# Envelope media type -> encoder; binary envelopes carry the audio as raw bytes
+ENCODERS: dict[str, Callable[[Any], bytes]] = {JSON: dumps_json}
+if msgpack is not None:
+    _packb = msgpack.packb
+
+    def _dumps_msgpack(payload: Any) -> bytes:
+        # packb only returns None when given a stream to write to
+        return cast(bytes, _packb(payload))
+
+    ENCODERS[MSGPACK] = _dumps_msgpack
+if cbor2 is not None:
+    ENCODERS[CBOR] = cbor2.dumps
+
+
+def binary(media_type: str) -> bool:
+    """Return True if the envelope can carry bytes, so the audio needs no base64."""
+    return media_type != JSON
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Pick the response type for an Accept header: "audio" for raw audio, else an envelope.
+
+    The highest q-value wins and earlier entries win ties; JSON is the default.
+    """
+    if not accept:
+        return JSON
+    best_type, best_q = JSON, -1.0
+    for media_range in accept.split(","):
+        media, _, params = media_range.strip().partition(";")
+        media = media.strip().lower()
+        media = _ALIASES.get(media, media)
+        if media in ("*/*", "application/*"):
+            media = JSON
+        elif media.startswith("audio/"):
+            media = "audio"
+        elif media not in ENCODERS:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best_type, best_q = media, q
+    return best_type if best_q > 0 else JSON
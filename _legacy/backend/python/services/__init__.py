@@ -1,6 +1,94 @@
-"""TTS service implementations."""
-from .gemini import synthesize as synthesize_gemini
-from .openai import synthesize as synthesize_openai
+"""TTS service implementations.
 
-__all__ = ["synthesize_gemini", "synthesize_openai"]
+Provider modules pull in heavy SDKs (google-auth, openai, httpx), so they are
+imported lazily the first time a service is used rather than at server import.
+"""
+import asyncio
+import importlib
+import logging
+from types import ModuleType
+from typing import TYPE_CHECKING, Iterable
 
+PROVIDERS = ("gemini", "openai")
+
+if TYPE_CHECKING:
+    # Resolved lazily by __getattr__ at runtime; declared here for type checkers
+    from .gemini import render as render_gemini, stream as stream_gemini, synthesize as synthesize_gemini
+    from .openai import render as render_openai, stream as stream_openai, synthesize as synthesize_openai
+
+logger = logging.getLogger(__name__)
+
+# Providers that have been imported and started, and imports in progress
+_loaded: dict[str, ModuleType] = {}
+_loading: dict[str, asyncio.Task] = {}
+
+
+def _import(name: str) -> ModuleType:
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown service: {name}")
+    return importlib.import_module(f".{name}", __name__)
+
+
+async def _load(name: str) -> ModuleType:
+    # Import in a worker thread so first use does not stall other requests
+    module = await asyncio.to_thread(_import, name)
+    await module.startup()
+    _loaded[name] = module
+    return module
+
+
+async def get_provider(name: str) -> ModuleType:
+    """Return a started provider module, importing it on first use."""
+    module = _loaded.get(name)
+    if module is not None:
+        return module
+    task = _loading.get(name)
+    if task is None:
+        task = _loading[name] = asyncio.create_task(_load(name))
+        task.add_done_callback(lambda _: _loading.pop(name, None))
+    return await asyncio.shield(task)
+
+
+async def warm_up(names: Iterable[str]) -> None:
+    """Import, start and pre-authenticate the given providers.
+    
+    Failures are logged rather than raised: a provider that cannot warm up will
+    report the same problem on its first request.
+    """
+    for name in names:
+        try:
+            module = await get_provider(name)
+            await module.warm_up()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("warm-up of %s failed: %s", name, e)
+
+
+def stats() -> dict:
+    """Return upstream rate limiter and client counters for every started provider."""
+    return {name: module.stats() for name, module in _loaded.items()}
+
+
+async def shutdown() -> None:
+    """Close shared upstream resources for every provider that was started."""
+    for task in list(_loading.values()):
+        task.cancel()
+    for name in list(_loaded):
+        await _loaded.pop(name).shutdown()
+
+
+def __getattr__(name: str):
+    # Keep the original synthesize_<service> exports, importing on access
+    prefix, _, service = name.rpartition("_")
+    if prefix in ("synthesize", "render", "stream") and service in PROVIDERS:
+        return getattr(_import(service), prefix)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = [
+    "PROVIDERS", "get_provider", "warm_up", "stats", "shutdown",
+    "synthesize_gemini", "synthesize_openai",
+    "render_gemini", "render_openai",
+    "stream_gemini", "stream_openai",
+]
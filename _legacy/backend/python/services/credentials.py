@@ -0,0 +1,216 @@
+"""Google OAuth2 access token management that never blocks the event loop."""
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from google.auth import default
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
+
+from shared_state import SharedStore
+
+
+def _seconds_until(expiry: Optional[datetime]) -> float:
+    """Return seconds until a naive UTC expiry (as google-auth stores it); inf if there is none."""
+    if expiry is None:
+        return float("inf")
+    return (expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+
+
+class TokenError(Exception):
+    """Raised when no valid access token can be obtained."""
+
+
+class TokenManager:
+    """Keep an access token fresh in the background and share refreshes between callers.
+
+    Refreshes run in a worker thread because google-auth performs a blocking HTTP
+    round trip. The token is renewed `refresh_margin` seconds before it expires, so
+    requests normally never wait on a refresh. Concurrent callers that do need a
+    refresh share a single one. A failed refresh is retried with jittered
+    exponential backoff instead of being remembered forever.
+
+    With a shared store, worker processes share one token: a refresh first looks
+    for a token another worker already published, and only one worker at a time
+    (the holder of a lease) asks Google for a new one.
+    """
+
+    # How long a refreshing worker holds the lease, and how long others wait for it
+    LEASE_SECONDS = 30.0
+    LEASE_WAIT_SECONDS = 10.0
+
+    def __init__(self, scopes: list[str], refresh_margin: float = 300.0,
+                 retry_initial: float = 1.0, retry_max: float = 60.0,
+                 store: Optional[SharedStore] = None):
+        self.scopes = scopes
+        self.refresh_margin = refresh_margin
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.refreshes = 0
+        self.adopted = 0
+        self.failures = 0
+        self._store = store
+        self._store_key = "google-token:" + " ".join(sorted(scopes))
+        self._owner = f"{os.getpid()}:{id(self)}"
+        self._credentials: Optional[Any] = None
+        self._token: Optional[str] = None
+        self._expiry: Optional[datetime] = None
+        self._error: Optional[str] = None
+        self._retry_at = 0.0
+        self._consecutive_failures = 0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._background: Optional[asyncio.Task] = None
+
+    def _load(self) -> Any:
+        """Load credentials from a service account key file or Application Default Credentials."""
+        # Try service account key file first (for sandboxed apps)
+        service_account_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        if service_account_path and os.path.exists(service_account_path):
+            return service_account.Credentials.from_service_account_file(
+                service_account_path,
+                scopes=self.scopes
+            )
+        # Fall back to Application Default Credentials with scopes
+        credentials, _ = default(scopes=self.scopes)
+        return credentials
+
+    def _fetch(self) -> None:
+        """Load credentials if needed and fetch a new token from Google."""
+        if self._credentials is None:
+            self._credentials = self._load()
+        self._credentials.refresh(Request())  # type: ignore
+        self._token = self._credentials.token  # type: ignore
+        self._expiry = self._credentials.expiry  # type: ignore
+
+    def _adopt_shared(self) -> bool:
+        """Use the token another worker published if it is not about to expire."""
+        shared = self._store.get(self._store_key)  # type: ignore
+        if shared is None:
+            return False
+        expiry = datetime.fromisoformat(shared["expiry"]) if shared["expiry"] else None
+        if _seconds_until(expiry) <= self.refresh_margin:
+            return False
+        self._token, self._expiry = shared["token"], expiry
+        self.adopted += 1
+        return True
+
+    def _refresh_blocking(self) -> bool:
+        """Obtain a fresh token (runs in a worker thread); returns False if it came from another worker."""
+        if self._store is None:
+            self._fetch()
+            return True
+        if self._adopt_shared():
+            return False
+        if not self._store.try_lease(self._store_key, self._owner, self.LEASE_SECONDS):
+            # Another worker is refreshing; wait for it to publish, then refresh ourselves
+            deadline = time.monotonic() + self.LEASE_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(0.1)
+                if self._adopt_shared():
+                    return False
+        try:
+            self._fetch()
+            shared = {"token": self._token, "expiry": self._expiry.isoformat() if self._expiry else None}
+            ttl = _seconds_until(self._expiry)
+            self._store.set(self._store_key, shared, ttl=ttl if ttl != float("inf") else None)
+        finally:
+            self._store.release_lease(self._store_key, self._owner)
+        return True
+
+    def _seconds_to_expiry(self) -> Optional[float]:
+        """Return seconds until the current token expires, or None if there is no token."""
+        if not self._token:
+            return None
+        return _seconds_until(self._expiry)
+
+    def _usable_token(self) -> Optional[str]:
+        """Return the current token if it is not about to expire."""
+        remaining = self._seconds_to_expiry()
+        if remaining is not None and remaining > 0:
+            return self._token
+        return None
+
+    async def _do_refresh(self) -> None:
+        if time.monotonic() < self._retry_at:
+            raise TokenError(self._error or "Token refresh backing off")
+        try:
+            fetched = await asyncio.to_thread(self._refresh_blocking)
+        except Exception as e:
+            self.failures += 1
+            self._consecutive_failures += 1
+            self._error = str(e)
+            backoff = min(self.retry_max, self.retry_initial * 2 ** (self._consecutive_failures - 1))
+            self._retry_at = time.monotonic() + backoff * random.uniform(0.5, 1.0)
+            raise TokenError(self._error) from e
+        self.refreshes += fetched
+        self._consecutive_failures = 0
+        self._error = None
+        self._retry_at = 0.0
+
+    async def refresh(self) -> None:
+        """Refresh the token, joining a refresh that is already in progress."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._do_refresh())
+        # Shield so one cancelled caller does not abort the refresh for the others
+        await asyncio.shield(self._refresh_task)
+
+    async def get_token(self) -> str:
+        """Return a valid access token, refreshing only if the current one is unusable."""
+        remaining = self._seconds_to_expiry()
+        if remaining is not None and remaining > self.refresh_margin:
+            return self._token  # type: ignore
+        try:
+            await self.refresh()
+        except TokenError:
+            # A token inside the refresh margin is still good until it actually expires
+            token = self._usable_token()
+            if token is None:
+                raise
+            return token
+        return self._token  # type: ignore
+
+    def _next_refresh_delay(self) -> float:
+        if self._retry_at:
+            return max(0.0, self._retry_at - time.monotonic())
+        remaining = self._seconds_to_expiry()
+        if remaining is None:
+            return 0.0
+        # Never spin, even if the token lifetime is shorter than the refresh margin
+        return max(1.0, min(remaining - self.refresh_margin, 3600.0))
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._next_refresh_delay())
+            try:
+                await self.refresh()
+            except TokenError:
+                pass
+
+    def start(self) -> None:
+        """Start refreshing ahead of expiry in the background; the first refresh happens now."""
+        if self._background is None:
+            self._background = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """Stop the background refresher."""
+        if self._background is not None:
+            task, self._background = self._background, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> dict:
+        """Return refresh counters and the current token lifetime."""
+        remaining = self._seconds_to_expiry()
+        return {
+            "refreshes": self.refreshes,
+            "adopted_from_other_workers": self.adopted,
+            "failures": self.failures,
+            "seconds_to_expiry": remaining if remaining != float("inf") else None,
+            "last_error": self._error,
+        }
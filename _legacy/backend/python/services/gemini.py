@@ -1,75 +1,189 @@
 """Google Gemini TTS service using Google Cloud Text-to-Speech API."""
+import asyncio
+import base64
 import json
-import os
-from typing import Optional, Tuple, Any
+import re
+from collections import deque
+from typing import AsyncIterator, Optional
 import httpx
 from fastapi import HTTPException
-from google.auth import default
-from google.auth.transport.requests import Request
-from google.oauth2 import service_account
+from audio import read_spooled, split_wav, spooled_buffer, streaming_wav_header
+from deadlines import http_timeout
+from metrics import stage_seconds
+from config import (
+    GEMINI_API_URL,
+    GEMINI_STREAM_PREFETCH,
+    GOOGLE_TOKEN_REFRESH_MARGIN,
+    GOOGLE_TOKEN_RETRY_INITIAL,
+    GOOGLE_TOKEN_RETRY_MAX,
+    GEMINI_REQUESTS_PER_SECOND,
+    GEMINI_CHARS_PER_MINUTE,
+    UPSTREAM_MAX_QUEUE,
+    UPSTREAM_MAX_QUEUE_WAIT,
+    UPSTREAM_RETRY_ATTEMPTS,
+    UPSTREAM_RETRY_INITIAL,
+    UPSTREAM_RETRY_MAX,
+)
+from segmentation import split_sentences
+from .credentials import TokenError, TokenManager
+from .http_pool import create_client
+from shared_state import get_store
+from .limits import UpstreamLimiter, retry_after_headers
+from .streams import UpstreamStream
 
 # Required OAuth scopes for Text-to-Speech API
 SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
 
-# Cache for credentials
-_credentials: Optional[Any] = None
-_credentials_error: Optional[str] = None
+API_URL = GEMINI_API_URL
 
-def _get_credentials() -> Tuple[Optional[Any], Optional[str]]:
-    """Get OAuth2 credentials using Application Default Credentials with correct scopes."""
-    global _credentials, _credentials_error
-    if _credentials is None and _credentials_error is None:
-        try:
-            # Try service account key file first (for sandboxed apps)
-            service_account_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-            if service_account_path and os.path.exists(service_account_path):
-                _credentials = service_account.Credentials.from_service_account_file(
-                    service_account_path,
-                    scopes=SCOPES
-                )
-                # Refresh if needed
-                if not _credentials.valid:  # type: ignore
-                    _credentials.refresh(Request())  # type: ignore
-            else:
-                # Fall back to Application Default Credentials with scopes
-                _credentials, _ = default(scopes=SCOPES)
-                # Refresh if needed
-                if not _credentials.valid:  # type: ignore
-                    _credentials.refresh(Request())  # type: ignore
-        except Exception as e:
-            _credentials_error = str(e)
-    return _credentials, _credentials_error
+# Format mapping
+FORMAT_MAP = {
+    "mp3": "MP3",
+    "wav": "LINEAR16",
+    "ogg": "OGG_OPUS",
+    "opus": "OGG_OPUS",
+}
 
+# Largest text input accepted by the Gemini TTS model
+MAX_INPUT_BYTES = 4000
 
-async def synthesize(text: str, voice: str = "Kore", language: str = "en-US", 
-                     audio_format: str = "mp3", prompt: Optional[str] = None) -> dict:
-    """Synthesize speech using Google Cloud Text-to-Speech API with Gemini model."""
-    credentials, error = _get_credentials()
-    
-    if credentials is None:
+# Longest segment sent upstream when streaming sentence by sentence
+STREAM_SEGMENT_MAX_BYTES = 500
+
+# Start of the base64 audio in a synthesize response body
+_AUDIO_CONTENT = re.compile(rb'"audioContent"\s*:\s*"')
+
+# Access tokens are refreshed in the background ahead of expiry
+_tokens = TokenManager(
+    SCOPES,
+    refresh_margin=GOOGLE_TOKEN_REFRESH_MARGIN,
+    retry_initial=GOOGLE_TOKEN_RETRY_INITIAL,
+    retry_max=GOOGLE_TOKEN_RETRY_MAX,
+    store=get_store(),
+)
+
+# Client-side rate limits, admission queue and retries for API calls
+_limiter = UpstreamLimiter(
+    "gemini",
+    requests_per_second=GEMINI_REQUESTS_PER_SECOND,
+    chars_per_minute=GEMINI_CHARS_PER_MINUTE,
+    max_queue=UPSTREAM_MAX_QUEUE,
+    max_wait=UPSTREAM_MAX_QUEUE_WAIT,
+    retry_attempts=UPSTREAM_RETRY_ATTEMPTS,
+    retry_initial=UPSTREAM_RETRY_INITIAL,
+    retry_max=UPSTREAM_RETRY_MAX,
+    store=get_store(),
+)
+
+# Shared connection pool, opened by the app lifespan
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def startup() -> None:
+    """Open the shared connection pool and start refreshing the access token."""
+    global _client
+    if _client is None:
+        _client = create_client(service="gemini")
+    _tokens.start()
+
+
+async def shutdown() -> None:
+    """Stop the token refresher and close the shared connection pool."""
+    global _client
+    await _tokens.stop()
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily when used outside the app lifespan."""
+    global _client
+    if _client is None:
+        _client = create_client(service="gemini")
+    return _client
+
+
+def stats() -> dict:
+    """Return rate limiter and access token counters."""
+    return {"limiter": _limiter.stats(), "token": _tokens.stats()}
+
+
+async def warm_up() -> None:
+    """Fetch an access token and open a connection ahead of the first request."""
+    await _tokens.get_token()
+    try:
+        await _get_client().head(API_URL)
+    except httpx.HTTPError:
+        pass
+
+
+async def _get_access_token() -> str:
+    """Return a valid OAuth2 access token, or raise 503 if authentication is not set up."""
+    try:
+        with stage_seconds.time("gemini", "credential"):
+            return await _tokens.get_token()
+    except TokenError as e:
         error_msg = (
             "Google Cloud TTS not configured. "
             "Set up authentication using one of:\n"
             "1. Service account: export GOOGLE_APPLICATION_CREDENTIALS=/path/to/key.json\n"
             "2. Application Default Credentials: gcloud auth application-default login\n"
-            f"Error: {error or 'Unknown authentication error'}"
+            f"Error: {e or 'Unknown authentication error'}"
         )
         raise HTTPException(503, error_msg)
+
+
+async def _read_audio_content(resp: httpx.Response) -> bytes:
+    """Decode the audioContent field of a streamed synthesize response.
     
-    # Get access token
-    if not credentials.valid:
-        credentials.refresh(Request())
-    access_token: str = credentials.token  # type: ignore
+    The base64 text is decoded as it arrives into a spooled buffer, so neither
+    the JSON body nor the base64 string is ever held whole.
+    """
+    head: Optional[bytes] = b""
+    pending = b""
+    done = False
+    with spooled_buffer() as buffer:
+        async for chunk in resp.aiter_bytes():
+            if done:
+                # Read the rest of the body so the connection can be reused
+                continue
+            if head is not None:
+                head += chunk
+                match = _AUDIO_CONTENT.search(head)
+                if match is None:
+                    continue
+                chunk, head = head[match.end():], None
+            end = chunk.find(b'"')
+            # Base64 has no backslashes or line breaks: drop JSON escapes of "/" and any wrapping
+            data = pending + (chunk if end < 0 else chunk[:end]).translate(None, b"\\\r\n")
+            usable = len(data) - len(data) % 4
+            buffer.write(base64.b64decode(data[:usable]))
+            pending = data[usable:]
+            done = end >= 0
+        if head is not None:
+            raise HTTPException(500, "Google Cloud TTS error: response has no audioContent")
+        buffer.write(base64.b64decode(pending))
+        return read_spooled(buffer)
+
+
+async def _synthesize_content(text: str, voice: str, language: str,
+                              audio_format: str, prompt: Optional[str], shed: bool = True) -> bytes:
+    """Call the Text-to-Speech API and return the decoded audio.
     
-    url = "https://texttospeech.googleapis.com/v1/text:synthesize"
+    Calls are paced by the rate limiter and retried on throttling and transient
+    errors; `shed=False` waits for a slot instead of failing when the queue is full.
+    """
+    if audio_format not in FORMAT_MAP:
+        raise HTTPException(
+            400,
+            f"Gemini cannot render {audio_format} directly. Supported formats: {', '.join(FORMAT_MAP)} "
+            "(other formats need local transcoding with ffmpeg)"
+        )
     
-    # Format mapping
-    format_map = {
-        "mp3": "MP3",
-        "wav": "LINEAR16",
-        "ogg": "OGG_OPUS",
-        "opus": "OGG_OPUS",
-    }
+    # Fetched before queueing so missing credentials fail fast; the token is
+    # refreshed well ahead of expiry, so it outlives any queueing and retries
+    access_token = await _get_access_token()
     
     payload = {
         "input": {"text": text},
@@ -79,37 +193,121 @@ async def synthesize(text: str, voice: str = "Kore", language: str = "en-US",
             "modelName": "gemini-2.5-flash-tts",
         },
         "audioConfig": {
-            "audioEncoding": format_map.get(audio_format, "MP3"),
+            "audioEncoding": FORMAT_MAP[audio_format],
         },
     }
     
     if prompt:
         payload["input"]["prompt"] = prompt
     
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json",
+    async def call() -> bytes:
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+        }
+        
+        try:
+            # Upstream timeouts are shortened to the request's remaining deadline
+            timeout = http_timeout() or httpx.USE_CLIENT_DEFAULT
+            async with _get_client().stream("POST", API_URL, json=payload, headers=headers,
+                                            timeout=timeout) as resp:
+                if resp.status_code != 200:
+                    await resp.aread()
+                    raise HTTPException(
+                        resp.status_code, f"Gemini API error: {resp.text}",
+                        headers=retry_after_headers(resp.headers),
+                    )
+                
+                return await _read_audio_content(resp)
+        except HTTPException:
+            raise
+        except httpx.TimeoutException as e:
+            raise HTTPException(504, f"Google Cloud TTS timed out: {str(e)}")
+        except Exception as e:
+            raise HTTPException(500, f"Google Cloud TTS error: {str(e)}")
+    
+    return await _limiter.call(call, len(text), shed=shed)
+
+
+async def synthesize(text: str, voice: str = "Kore", language: str = "en-US", 
+                     audio_format: str = "mp3", prompt: Optional[str] = None) -> dict:
+    """Synthesize speech using Google Cloud Text-to-Speech API with Gemini model."""
+    audio_bytes = await _synthesize_content(text, voice, language, audio_format, prompt)
+    
+    word_count = len(text.split())
+    duration_ms = int((word_count / 150) * 60 * 1000)
+    
+    return {
+        "audio_data": base64.b64encode(audio_bytes).decode("ascii"),
+        "audio_format": audio_format,
+        "duration_ms": duration_ms,
+        "metadata": json.dumps({"service": "gemini", "voice": voice}),
     }
+
+
+async def render(text: str, voice: str = "Kore", language: str = "en-US",
+                 audio_format: str = "mp3", prompt: Optional[str] = None) -> dict:
+    """Synthesize speech and return the raw audio bytes instead of base64."""
+    audio_bytes = await _synthesize_content(text, voice, language, audio_format, prompt)
+    
+    word_count = len(text.split())
+    duration_ms = int((word_count / 150) * 60 * 1000)
+    
+    return {
+        "audio_bytes": audio_bytes,
+        "audio_format": audio_format,
+        "duration_ms": duration_ms,
+        "metadata": json.dumps({"service": "gemini", "voice": voice}),
+    }
+
+
+async def stream(text: str, voice: str = "Kore", language: str = "en-US",
+                 audio_format: str = "mp3", prompt: Optional[str] = None) -> UpstreamStream:
+    """Synthesize sentence-sized segments and return an iterator yielding their audio in order.
+    
+    Up to GEMINI_STREAM_PREFETCH segments are rendered ahead of the one being sent. The
+    first segment is awaited before returning so that configuration and upstream errors
+    surface as HTTP errors instead of a truncated stream. The caller must aclose() the
+    stream, which cancels the segments still rendering.
+    """
+    segments = split_sentences(text, max_bytes=STREAM_SEGMENT_MAX_BYTES) or [text]
+    pending: deque[asyncio.Task] = deque()
+    next_index = 0
     
+    def schedule() -> None:
+        nonlocal next_index
+        while next_index < len(segments) and len(pending) < GEMINI_STREAM_PREFETCH:
+            # Only the first segment may be shed; the rest belong to an admitted stream
+            pending.append(asyncio.create_task(
+                _synthesize_content(segments[next_index], voice, language, audio_format, prompt,
+                                    shed=next_index == 0)
+            ))
+            next_index += 1
+    
+    def cancel_pending() -> None:
+        for task in pending:
+            task.cancel()
+    
+    schedule()
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(url, json=payload, headers=headers)
-            
-            if resp.status_code != 200:
-                raise HTTPException(resp.status_code, f"Gemini API error: {resp.text}")
-            
-            data = resp.json()
-            word_count = len(text.split())
-            duration_ms = int((word_count / 150) * 60 * 1000)
-            
-            return {
-                "audio_data": data["audioContent"],
-                "audio_format": audio_format,
-                "duration_ms": duration_ms,
-                "metadata": json.dumps({"service": "gemini", "voice": voice}),
-            }
-    except HTTPException:
+        await pending[0]
+    except BaseException:
+        cancel_pending()
         raise
-    except Exception as e:
-        raise HTTPException(500, f"Google Cloud TTS error: {str(e)}")
-
+    
+    async def chunks() -> AsyncIterator[bytes]:
+        first = True
+        while pending:
+            audio = await pending.popleft()
+            schedule()
+            if audio_format == "wav":
+                # LINEAR16 segments are full WAV files; send one header, then raw samples
+                header, samples = split_wav(audio)
+                audio = streaming_wav_header(header) + samples if first else samples
+            first = False
+            yield audio
+    
+    async def close() -> None:
+        cancel_pending()
+    
+    return UpstreamStream(chunks(), close)
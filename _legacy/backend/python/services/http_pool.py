@@ -0,0 +1,84 @@
+"""Pooled HTTP clients shared by the upstream TTS providers."""
+import importlib.util
+import time
+from typing import Optional
+import httpx
+from config import (
+    HTTP2_ENABLED,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_WRITE_TIMEOUT,
+    HTTP_POOL_TIMEOUT,
+)
+from metrics import stage_seconds
+
+
+class _StageTracer:
+    """httpcore trace callback that times connection setup, time to headers and body download."""
+
+    __slots__ = ("service", "_connecting", "_sent", "_receiving")
+
+    def __init__(self, service: str):
+        self.service = service
+        self._connecting: Optional[float] = None
+        self._sent: Optional[float] = None
+        self._receiving: Optional[float] = None
+
+    async def __call__(self, event: str, info: dict) -> None:
+        now = time.perf_counter()
+        if event == "connection.connect_tcp.started":
+            self._connecting = now
+        elif event.endswith(".send_request_headers.started"):
+            # Connection setup (TCP, TLS, HTTP/2 preamble) ends when the request goes out
+            if self._connecting is not None:
+                stage_seconds.observe(now - self._connecting, self.service, "connect")
+                self._connecting = None
+            self._sent = now
+        elif event.endswith(".receive_response_headers.complete") and self._sent is not None:
+            stage_seconds.observe(now - self._sent, self.service, "upstream")
+        elif event.endswith(".receive_response_body.started"):
+            self._receiving = now
+        elif event.endswith(".receive_response_body.complete") and self._receiving is not None:
+            stage_seconds.observe(now - self._receiving, self.service, "download")
+
+
+def _trace_requests(service: str):
+    async def attach(request: httpx.Request) -> None:
+        request.extensions["trace"] = _StageTracer(service)
+    return attach
+
+
+def http2_available() -> bool:
+    """Return True if the optional h2 package needed for HTTP/2 is installed."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_client(http2: bool = HTTP2_ENABLED, service: Optional[str] = None, **kwargs) -> httpx.AsyncClient:
+    """Create an async client with the configured keep-alive limits and per-phase timeouts.
+
+    With `service`, every request records connect, upstream and download stage
+    timings for that provider.
+    """
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=HTTP_CONNECT_TIMEOUT,
+        read=HTTP_READ_TIMEOUT,
+        write=HTTP_WRITE_TIMEOUT,
+        pool=HTTP_POOL_TIMEOUT,
+    )
+    if service is not None:
+        kwargs.setdefault("event_hooks", {}).setdefault("request", []).append(_trace_requests(service))
+    # Fall back to HTTP/1.1 keep-alive when h2 is not installed
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=timeout,
+        http2=http2 and http2_available(),
+        **kwargs,
+    )
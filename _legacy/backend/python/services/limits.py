@@ -0,0 +1,317 @@
+"""Client-side rate limiting, admission control and retries for upstream calls."""
+import asyncio
+import math
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Iterator, Mapping, Optional, TypeVar
+
+from fastapi import HTTPException
+
+from deadlines import DeadlineExceeded, remaining
+from metrics import stage_seconds, upstream_errors
+from shared_state import SharedStore
+
+T = TypeVar("T")
+
+# Upstream statuses worth retrying: throttling, timeouts and transient server errors
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class LocalWait:
+    """Seconds an upstream call spent waiting on this side: rate limit queue, backoff, slots."""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+
+# Wait of the upstream call the current task is making, if it is being measured
+_local_wait: ContextVar[Optional[LocalWait]] = ContextVar("local_wait", default=None)
+
+
+@contextmanager
+def measure_local_wait() -> Iterator[LocalWait]:
+    """Collect the local waits of the calls made inside the block, to leave them out of latencies."""
+    wait = LocalWait()
+    token = _local_wait.set(wait)
+    try:
+        yield wait
+    finally:
+        _local_wait.reset(token)
+
+
+def add_local_wait(seconds: float) -> None:
+    """Count `seconds` of waiting towards the call being measured, if any."""
+    wait = _local_wait.get()
+    if wait is not None:
+        wait.seconds += seconds
+
+
+class Overloaded(HTTPException):
+    """Raised when a request is shed locally instead of being sent upstream."""
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(503, detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def retry_after_headers(headers: Mapping[str, str]) -> Optional[dict]:
+    """Carry an upstream Retry-After header over to the HTTPException raised for it."""
+    value = headers.get("retry-after")
+    return {"Retry-After": value} if value else None
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations, letting the balance go negative.
+
+    A reservation that overdraws the bucket is told how long to wait, and later
+    reservations queue up behind it, so waiting callers are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Return seconds until `amount` tokens are available, without taking them."""
+        self._refill()
+        return max(0.0, (amount - self._tokens) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self._tokens -= amount
+
+    def give_back(self, amount: float) -> None:
+        """Return a reservation that was never used."""
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class SharedTokenBucket:
+    """TokenBucket whose balance lives in the shared store, so every worker draws on one budget."""
+
+    def __init__(self, store: SharedStore, name: str, rate: float, capacity: float):
+        self.store = store
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        with store.transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def _tokens(self, db, now: float) -> float:
+        row = db.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+        if row is None:
+            return self.capacity
+        return min(self.capacity, row[0] + (now - row[1]) * self.rate)
+
+    def _add(self, amount: float) -> None:
+        # Wall-clock time, since monotonic clocks are not comparable between processes
+        now = time.time()
+        with self.store.transaction() as db:
+            tokens = min(self.capacity, self._tokens(db, now) + amount)
+            db.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (self.name, tokens, now))
+
+    def delay(self, amount: float) -> float:
+        """Return seconds until `amount` tokens are available, without taking them."""
+        return max(0.0, (amount - self._tokens(self.store.connection(), time.time())) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._add(-amount)
+
+    def give_back(self, amount: float) -> None:
+        """Return a reservation that was never used."""
+        self._add(amount)
+
+
+class UpstreamLimiter:
+    """Admission control in front of one provider.
+
+    Requests are paced by a requests-per-second and a characters-per-minute token
+    bucket. Callers that must wait do so in a bounded queue; when the queue is full,
+    or the wait would exceed `max_wait`, the request is shed with 503 and a
+    Retry-After instead of piling onto an upstream that is already saturated.
+    Throttled and transient failures are retried with jittered exponential backoff,
+    honouring the upstream Retry-After, which also pauses every other caller.
+
+    With a shared store the buckets and pauses are shared by all worker processes,
+    so the limits hold for the host rather than per worker; the queue is per worker.
+    """
+
+    def __init__(self, name: str, requests_per_second: float = 0.0, chars_per_minute: float = 0.0,
+                 max_queue: int = 100, max_wait: float = 10.0, retry_attempts: int = 3,
+                 retry_initial: float = 0.5, retry_max: float = 8.0, store: Optional[SharedStore] = None):
+        self.name = name
+        self._store = store
+
+        def bucket(kind: str, rate: float, capacity: float):
+            if store is not None:
+                return SharedTokenBucket(store, f"{name}:{kind}", rate, capacity)
+            return TokenBucket(rate, capacity)
+
+        self._requests = bucket("requests", requests_per_second, max(1.0, requests_per_second)) \
+            if requests_per_second > 0 else None
+        self._chars = bucket("chars", chars_per_minute / 60, chars_per_minute) if chars_per_minute > 0 else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.retry_attempts = max(1, retry_attempts)
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self._paused_until = 0.0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.retries = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _paused_for(self) -> float:
+        if self._store is not None:
+            return max(0.0, (self._store.get(f"pause:{self.name}") or 0.0) - time.time())
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def _buckets(self, chars: int) -> list[tuple[SharedTokenBucket | TokenBucket, int]]:
+        buckets = [(self._requests, 1), (self._chars, chars)]
+        return [(bucket, amount) for bucket, amount in buckets if bucket is not None]
+
+    def _reserve(self, chars: int, max_delay: Optional[float]) -> float:
+        """Return the wait before this request may go, taking its tokens unless it exceeds max_delay."""
+        delay = self._paused_for()
+        for bucket, amount in self._buckets(chars):
+            delay = max(delay, bucket.delay(amount))
+        if max_delay is None or delay <= max_delay:
+            for bucket, amount in self._buckets(chars):
+                bucket.take(amount)
+        return delay
+
+    def _give_back(self, chars: int) -> None:
+        for bucket, amount in self._buckets(chars):
+            bucket.give_back(amount)
+
+    async def acquire(self, chars: int, shed: bool = True) -> None:
+        """Wait for this request's turn under the rate limits, or raise Overloaded.
+
+        With `shed=False` the request always waits; used for work that was already
+        admitted, such as retries and later segments of a stream. Either way, a
+        wait longer than the request's remaining deadline fails immediately.
+        """
+        left = remaining()
+        max_delay = left
+        if shed:
+            limit = 0.0 if self.waiting >= self.max_queue else self.max_wait
+            max_delay = limit if max_delay is None else min(max_delay, limit)
+        if self._store is not None:
+            # Shared buckets are SQLite transactions that may wait on other workers
+            delay = await asyncio.to_thread(self._reserve, chars, max_delay)
+        else:
+            delay = self._reserve(chars, max_delay)
+        if left is not None and delay > left:
+            raise DeadlineExceeded(f"{self.name} rate limit wait exceeds the request deadline")
+        if shed and delay > 0:
+            if self.waiting >= self.max_queue:
+                self.shed += 1
+                raise Overloaded(f"{self.name} request queue is full, retry later", delay)
+            if delay > self.max_wait:
+                self.shed += 1
+                raise Overloaded(f"{self.name} is rate limited, retry later", delay)
+        self.admitted += 1
+        if delay > 0:
+            self.waiting += 1
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                if self._store is not None:
+                    # Not awaited: the caller is going away and must not wait on the store
+                    asyncio.get_running_loop().run_in_executor(None, self._give_back, chars)
+                else:
+                    self._give_back(chars)
+                raise
+            finally:
+                self.waiting -= 1
+        self._wait_total += delay
+        self._wait_max = max(self._wait_max, delay)
+        stage_seconds.observe(delay, self.name, "queue")
+
+    def _pause(self, seconds: float) -> None:
+        if self._store is not None:
+            if seconds > self._paused_for():
+                self._store.set(f"pause:{self.name}", time.time() + seconds, ttl=seconds)
+            return
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def pause(self, seconds: float) -> None:
+        """Hold back every caller for `seconds`, e.g. after an upstream 429."""
+        if self._store is not None:
+            await asyncio.to_thread(self._pause, seconds)
+        else:
+            self._pause(seconds)
+
+    async def call(self, fn: Callable[[], Awaitable[T]], chars: int, shed: bool = True) -> T:
+        """Run `fn` under the rate limits, retrying throttled and transient failures."""
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            await self.acquire(chars, shed=shed and attempt == 0)
+            add_local_wait(time.perf_counter() - start)
+            try:
+                return await fn()
+            except HTTPException as e:
+                upstream_errors.inc(self.name, str(e.status_code))
+                attempt += 1
+                if e.status_code not in RETRY_STATUSES or attempt >= self.retry_attempts:
+                    raise
+                delay = retry_after_seconds((e.headers or {}).get("Retry-After"))
+                if delay is None:
+                    backoff = min(self.retry_max, self.retry_initial * 2 ** (attempt - 1))
+                    delay = backoff * random.uniform(0.5, 1.0)
+                elif delay > self.retry_max:
+                    # Longer than we are willing to hold the caller; let them retry later
+                    raise
+                else:
+                    await self.pause(delay)
+                left = remaining()
+                if left is not None and delay >= left:
+                    # The retry could not finish before the caller gives up
+                    raise
+                self.retries += 1
+                await asyncio.sleep(delay)
+                add_local_wait(delay)
+
+    def stats(self) -> dict:
+        """Return the configured limits, queue depth and wait-time counters."""
+        return {
+            "requests_per_second": self._requests.rate if self._requests else None,
+            "chars_per_minute": self._chars.rate * 60 if self._chars else None,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "retries": self.retries,
+            "wait_ms_avg": self._wait_total / self.admitted * 1000 if self.admitted else 0.0,
+            "wait_ms_max": self._wait_max * 1000,
+        }
@@ -1,23 +1,102 @@
 """OpenAI TTS service."""
+import asyncio
 import base64
 import json
-from typing import Optional, Literal, cast
+import time
+from typing import AsyncIterator, Optional, Literal, cast
 from fastapi import HTTPException
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from audio import read_spooled, spooled_buffer
+from openai import NOT_GIVEN, APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_REQUESTS_PER_SECOND,
+    OPENAI_CHARS_PER_MINUTE,
+    UPSTREAM_MAX_QUEUE,
+    UPSTREAM_MAX_QUEUE_WAIT,
+    UPSTREAM_RETRY_ATTEMPTS,
+    UPSTREAM_RETRY_INITIAL,
+    UPSTREAM_RETRY_MAX,
+)
+from deadlines import http_timeout
+from .http_pool import create_client
+from shared_state import get_store
+from .limits import UpstreamLimiter, add_local_wait, retry_after_headers
+from .streams import UpstreamStream
 
 # Type aliases for OpenAI API
 OpenAIVoice = Literal["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
 OpenAIAudioFormat = Literal["mp3", "opus", "aac", "flac", "wav", "pcm"]
 
+# Largest text input accepted by the speech endpoint (4096 characters, counted
+# here in UTF-8 bytes so that the limit is never exceeded)
+MAX_INPUT_BYTES = 4096
 
-async def synthesize(text: str, voice: str = "alloy", language: Optional[str] = None,
-                     audio_format: str = "mp3", speed: float = 1.0, instructions: Optional[str] = None) -> dict:
-    """Synthesize speech using OpenAI TTS with streaming response."""
+# Shared async client, opened by the app lifespan
+_client: Optional[AsyncOpenAI] = None
+
+# Caps concurrent upstream calls so a burst cannot exhaust the connection pool
+_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+# Client-side rate limits, admission queue and retries for API calls
+_limiter = UpstreamLimiter(
+    "openai",
+    requests_per_second=OPENAI_REQUESTS_PER_SECOND,
+    chars_per_minute=OPENAI_CHARS_PER_MINUTE,
+    max_queue=UPSTREAM_MAX_QUEUE,
+    max_wait=UPSTREAM_MAX_QUEUE_WAIT,
+    retry_attempts=UPSTREAM_RETRY_ATTEMPTS,
+    retry_initial=UPSTREAM_RETRY_INITIAL,
+    retry_max=UPSTREAM_RETRY_MAX,
+    store=get_store(),
+)
+
+
+def _create_client() -> AsyncOpenAI:
+    # Retries are handled by _limiter, which honours Retry-After across all callers
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=create_client(service="openai"), max_retries=0)
+
+
+async def startup() -> None:
+    """Open the shared OpenAI client and its connection pool."""
+    global _client
+    if _client is None and OPENAI_API_KEY:
+        _client = _create_client()
+
+
+async def shutdown() -> None:
+    """Close the shared OpenAI client and release its sockets."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
+
+
+async def warm_up() -> None:
+    """Create the shared client ahead of the first request."""
+    if not OPENAI_API_KEY:
+        raise HTTPException(503, "OpenAI TTS not configured. Set OPENAI_API_KEY in .env")
+    _get_client()
+
+
+def _get_client() -> AsyncOpenAI:
+    """Return the shared client, creating it lazily when used outside the app lifespan."""
+    global _client
+    if _client is None:
+        _client = _create_client()
+    return _client
+
+
+def stats() -> dict:
+    """Return rate limiter counters."""
+    return {"limiter": _limiter.stats()}
+
+
+def _request_params(text: str, voice: str, audio_format: str, speed: float,
+                    instructions: Optional[str]) -> dict:
+    """Validate the request and build the OpenAI speech parameters."""
     if not OPENAI_API_KEY:
         raise HTTPException(503, "OpenAI TTS not configured. Set OPENAI_API_KEY in .env")
-    
-    client = OpenAI(api_key=OPENAI_API_KEY)
     
     # Validate and cast voice
     valid_voices: list[OpenAIVoice] = ["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
@@ -31,38 +110,105 @@ async def synthesize(text: str, voice: str = "alloy", language: Optional[str] =
         raise HTTPException(400, f"Invalid audio format. Must be one of: {', '.join(valid_formats)}")
     format_literal = cast(OpenAIAudioFormat, audio_format)
     
+    # Build request parameters
+    request_params = {
+        "model": "gpt-4o-mini-tts",
+        "voice": voice_literal,
+        "input": text,
+        "response_format": format_literal,
+        "speed": speed,
+    }
+    
+    # Add instructions if provided
+    if instructions:
+        request_params["instructions"] = instructions
+    
+    return request_params
+
+
+def _api_error(e: Exception) -> HTTPException:
+    """Translate an SDK error into an HTTPException that keeps the upstream status."""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, APIStatusError):
+        return HTTPException(
+            e.status_code, f"OpenAI API error: {e.message}",
+            headers=retry_after_headers(e.response.headers),
+        )
+    if isinstance(e, APITimeoutError):
+        return HTTPException(504, f"OpenAI API timed out: {str(e)}")
+    if isinstance(e, APIConnectionError):
+        return HTTPException(502, f"OpenAI API connection error: {str(e)}")
+    return HTTPException(500, f"OpenAI API error: {str(e)}")
+
+
+async def stream(text: str, voice: str = "alloy", language: Optional[str] = None,
+                 audio_format: str = "mp3", speed: float = 1.0,
+                 instructions: Optional[str] = None) -> UpstreamStream:
+    """Open an upstream speech stream and return an iterator over its chunks as they arrive.
+    
+    The upstream response headers are awaited before returning so that errors surface as
+    HTTP errors instead of a truncated stream. The caller must aclose() the stream.
+    """
+    request_params = _request_params(text, voice, audio_format, speed, instructions)
+    
+    async def open_stream():
+        start = time.perf_counter()
+        await _semaphore.acquire()
+        add_local_wait(time.perf_counter() - start)
+        try:
+            # Upstream timeouts are shortened to the request's remaining deadline
+            timeout = http_timeout() or NOT_GIVEN
+            context = _get_client().audio.speech.with_streaming_response.create(**request_params, timeout=timeout)
+            return context, await context.__aenter__()
+        except Exception as e:
+            _semaphore.release()
+            raise _api_error(e)
+        except BaseException:
+            _semaphore.release()
+            raise
+    
+    context, response = await _limiter.call(open_stream, len(text))
+    
+    async def close() -> None:
+        try:
+            await context.__aexit__(None, None, None)
+        finally:
+            _semaphore.release()
+    
+    return UpstreamStream(response.iter_bytes(), close)
+
+
+async def render(text: str, voice: str = "alloy", language: Optional[str] = None,
+                 audio_format: str = "mp3", speed: float = 1.0, instructions: Optional[str] = None) -> dict:
+    """Synthesize speech and return the raw audio bytes instead of base64."""
+    chunks = await stream(text, voice, language, audio_format, speed, instructions)
+    
     try:
-        # Build request parameters
-        request_params = {
-            "model": "gpt-4o-mini-tts",
-            "voice": voice_literal,
-            "input": text,
-            "response_format": format_literal,
-            "speed": speed,
-        }
-        
-        # Add instructions if provided
-        if instructions:
-            request_params["instructions"] = instructions
-        
-        # Use streaming response
-        with client.audio.speech.with_streaming_response.create(**request_params) as response:
-            # Collect all chunks into bytes
-            audio_bytes = b""
-            for chunk in response.iter_bytes():
-                audio_bytes += chunk
-        
-        audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
-        
-        word_count = len(text.split())
-        duration_ms = int((word_count / 150) * 60 * 1000)
-        
-        return {
-            "audio_data": audio_base64,
-            "audio_format": audio_format,
-            "duration_ms": duration_ms,
-            "metadata": json.dumps({"service": "openai", "voice": voice, "instructions": instructions}),
-        }
+        # Collect the chunks without growing a buffer that is copied again at the end
+        with spooled_buffer() as buffer:
+            async for chunk in chunks:
+                buffer.write(chunk)
+            audio_bytes = read_spooled(buffer)
     except Exception as e:
-        raise HTTPException(500, f"OpenAI API error: {str(e)}")
+        raise _api_error(e)
+    finally:
+        await chunks.aclose()
+    
+    word_count = len(text.split())
+    duration_ms = int((word_count / 150) * 60 * 1000)
+    
+    return {
+        "audio_bytes": audio_bytes,
+        "audio_format": audio_format,
+        "duration_ms": duration_ms,
+        "metadata": json.dumps({"service": "openai", "voice": voice, "instructions": instructions}),
+    }
+
 
+async def synthesize(text: str, voice: str = "alloy", language: Optional[str] = None,
+                     audio_format: str = "mp3", speed: float = 1.0, instructions: Optional[str] = None) -> dict:
+    """Synthesize speech using OpenAI TTS with streaming response."""
+    result = await render(text, voice, language, audio_format, speed, instructions)
+    audio_base64 = base64.b64encode(result.pop("audio_bytes")).decode("utf-8")
+    return {"audio_data": audio_base64, **result}
@@ -0,0 +1,33 @@
+"""Upstream audio streams whose resources are released even if they are never iterated."""
+from typing import AsyncIterator, Awaitable, Callable
+
+
+class UpstreamStream:
+    """Audio chunks from an open upstream stream, with an idempotent aclose().
+
+    An async generator that never starts never runs its `finally`, so a stream
+    opened for a client that disconnects before the body is sent would keep its
+    connection, semaphore slot or prefetch tasks. Callers must aclose() the
+    stream; running out of chunks or failing closes it too.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], close: Callable[[], Awaitable[None]]):
+        self._chunks = chunks
+        self._close = close
+        self._closed = False
+
+    def __aiter__(self) -> "UpstreamStream":
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            return await self._chunks.__anext__()
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        await self._close()
@@ -0,0 +1,93 @@
+"""SQLite-backed state shared by every worker process on a host.
+
+Used for the things that must not be multiplied by the worker count: the Google
+access token, rate-limit buckets and upstream pauses. The disk cache keeps its
+own index database in the cache directory through the same helper.
+
+The database runs in WAL mode without fsync on commit, so a short transaction
+costs tens of microseconds and readers never block writers.
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from config import SHARED_STATE_ENABLED, SHARED_STATE_PATH
+
+
+class SharedStore:
+    """A SQLite database with one connection per thread and a key/value table with expiry."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self.transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a write transaction, taking the database lock up front to avoid upgrade deadlocks."""
+        db = self.connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the JSON value stored under key, or None if it is missing or expired."""
+        row = self.connection().execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, json.dumps(value), expires_at))
+
+    def try_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take a named lease unless another owner holds an unexpired one."""
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute("SELECT value, expires_at FROM kv WHERE key = ?", (f"lease:{name}",)).fetchone()
+            if row is not None and row[1] > now and json.loads(row[0]) != owner:
+                return False
+            db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (f"lease:{name}", json.dumps(owner), now + ttl))
+            return True
+
+    def release_lease(self, name: str, owner: str) -> None:
+        with self.transaction() as db:
+            db.execute("DELETE FROM kv WHERE key = ? AND value = ?", (f"lease:{name}", json.dumps(owner)))
+
+
+_store: Optional[SharedStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> Optional[SharedStore]:
+    """Return the process-wide shared store, or None when shared state is disabled."""
+    global _store
+    if not SHARED_STATE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = SharedStore(SHARED_STATE_PATH)
+    return _store
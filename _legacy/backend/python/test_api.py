@@ -1,6 +1,7 @@
 """Simple test script for the TTS API."""
 import asyncio
 import json
+import time
 import httpx
 
 
@@ -9,7 +10,7 @@ async def test_synthesize(service: str = "gemini"):
     payload = {
         "text": "Hello, this is a test!",
         "service": service,
-        "voice": "Kore" if service == "gemini" else "alloy",
+        "voice": "alloy" if service == "openai" else "Kore",
         "audio_format": "mp3",
     }
     
@@ -28,10 +29,193 @@ async def test_synthesize(service: str = "gemini"):
             print(f"✓ Audio format: {data['audio_format']}")
             print(f"✓ Duration: {data['duration_ms']}ms")
             print(f"✓ Audio data: {len(data['audio_data'])} chars")
+            print(f"✓ Cache: {response.headers.get('X-Cache', 'disabled')}")
+            if service == "auto":
+                print(f"✓ Provider: {response.headers.get('X-Provider')} (hedged: {response.headers.get('X-Hedged', 'false')})")
         else:
             print(f"✗ Error: {response.text}")
 
 
+async def test_raw(service: str = "gemini"):
+    """Request raw audio bytes via the Accept header instead of base64 JSON."""
+    payload = {
+        "text": "Hello, this is a raw audio test!",
+        "service": service,
+        "audio_format": "mp3",
+    }
+    
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        response = await client.post(
+            "http://localhost:8000/api/v1/tts/synthesize",
+            json=payload,
+            headers={"Accept": "audio/*"},
+        )
+        print(f"\n{service.upper()} raw: {response.status_code}")
+        
+        if response.status_code == 200:
+            print(f"✓ Content type: {response.headers['content-type']}")
+            print(f"✓ Duration: {response.headers.get('x-audio-duration-ms')}ms")
+            print(f"✓ Audio data: {len(response.content)} bytes")
+        else:
+            print(f"✗ Error: {response.text}")
+
+
+async def test_stream(service: str = "openai"):
+    """Measure time-to-first-byte and total time of the streaming endpoint."""
+    payload = {
+        "text": "Hello, this is a streaming test. It has a few sentences. Playback can start early!",
+        "service": service,
+        "audio_format": "mp3",
+    }
+    
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        start = time.perf_counter()
+        ttfb = None
+        total_bytes = 0
+        async with client.stream("POST", "http://localhost:8000/api/v1/tts/stream", json=payload) as response:
+            print(f"\n{service.upper()} stream: {response.status_code}")
+            if response.status_code != 200:
+                print(f"✗ Error: {(await response.aread()).decode()}")
+                return
+            async for chunk in response.aiter_bytes():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                total_bytes += len(chunk)
+        total = time.perf_counter() - start
+        
+        print(f"✓ Content type: {response.headers['content-type']}")
+        print(f"✓ Server timing: {response.headers.get('server-timing')}")
+        print(f"✓ First byte: {(ttfb or 0) * 1000:.0f}ms, complete: {total * 1000:.0f}ms, {total_bytes} bytes")
+
+
+async def test_websocket(service: str = "openai"):
+    """Send text word by word over the WebSocket and time the first audio segment."""
+    import websockets
+    
+    words = "Hello, this text arrives word by word. Speech should start after the first sentence.".split()
+    async with websockets.connect("ws://localhost:8000/api/v1/tts/ws") as ws:
+        await ws.send(json.dumps({"type": "start", "service": service, "audio_format": "mp3"}))
+        start = time.perf_counter()
+        for word in words:
+            await ws.send(json.dumps({"type": "text", "text": word + " "}))
+        await ws.send(json.dumps({"type": "end"}))
+        
+        print(f"\n{service.upper()} websocket:")
+        first_audio = None
+        while True:
+            message = json.loads(await ws.recv())
+            if message["type"] == "segment":
+                audio = await ws.recv()
+                if first_audio is None:
+                    first_audio = time.perf_counter() - start
+                print(f"✓ Segment {message['index']}: {len(audio)} bytes - {message['text']!r}")
+            elif message["type"] == "error":
+                print(f"✗ Error: {message}")
+            elif message["type"] == "done":
+                break
+        print(f"✓ First audio: {(first_audio or 0) * 1000:.0f}ms, complete: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+async def test_batch():
+    """Render several items in one batch request and report per-item status."""
+    payload = {
+        "items": [
+            {"text": f"Batch item number {i}.", "service": service, "audio_format": "mp3"}
+            for i in range(3)
+            for service in ("gemini", "openai")
+        ]
+    }
+    
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        start = time.perf_counter()
+        response = await client.post("http://localhost:8000/api/v1/tts/batch", json=payload)
+        elapsed = time.perf_counter() - start
+        print(f"\nBATCH: {response.status_code} in {elapsed:.2f}s")
+        
+        if response.status_code == 200:
+            for item in response.json()["results"]:
+                mark = "✓" if item["status_code"] == 200 else "✗"
+                print(f"{mark} Item {item['index']}: {item['status_code']} {item['error'] or ''}")
+        else:
+            print(f"✗ Error: {response.text}")
+
+
+async def test_deadline(service: str = "gemini"):
+    """Send a request with a deadline too short to meet and expect a prompt 504."""
+    payload = {"text": "This request cannot finish in ten milliseconds.", "service": service}
+    
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        start = time.perf_counter()
+        response = await client.post(
+            "http://localhost:8000/api/v1/tts/synthesize", json=payload, headers={"X-Request-Timeout": "0.01"}
+        )
+        elapsed = time.perf_counter() - start
+        print(f"\n{service.upper()} deadline: {response.status_code} in {elapsed:.2f}s")
+        
+        if response.status_code == 504 and elapsed < 1:
+            print("✓ Deadline enforced")
+        else:
+            print(f"✗ Expected a prompt 504: {response.text[:200]}")
+
+
+async def test_audio_url(service: str = "openai"):
+    """Store audio with url=true, then fetch it whole, by range and revalidated by ETag."""
+    payload = {"text": "Hello, this is an audio URL test!", "service": service, "audio_format": "mp3"}
+    
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        response = await client.post("http://localhost:8000/api/v1/tts/synthesize?url=true", json=payload)
+        print(f"\n{service.upper()} audio URL: {response.status_code}")
+        
+        if response.status_code == 400:
+            print("- Audio store disabled, skipped")
+            return
+        if response.status_code != 200:
+            print(f"✗ Error: {response.text}")
+            return
+        audio_url = response.json()["audio_url"]
+        print(f"✓ URL: {audio_url}")
+        
+        whole = await client.get(audio_url)
+        part = await client.get(audio_url, headers={"Range": "bytes=0-99"})
+        cached = await client.get(audio_url, headers={"If-None-Match": whole.headers["etag"]})
+        print(f"✓ Audio data: {len(whole.content)} bytes")
+        if part.status_code == 206 and part.content == whole.content[:100] and cached.status_code == 304:
+            print("✓ Range and ETag revalidation")
+        else:
+            print(f"✗ Range {part.status_code}, If-None-Match {cached.status_code}")
+
+
+async def test_concurrency(service: str = "openai", n: int = 5):
+    """Check that N concurrent requests finish in roughly the time of one."""
+    payload = {
+        "text": "Hello, this is a concurrency test!",
+        "service": service,
+        "audio_format": "mp3",
+    }
+    
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        url = "http://localhost:8000/api/v1/tts/synthesize"
+        
+        start = time.perf_counter()
+        await client.post(url, json=payload)
+        single = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.post(url, json=payload) for _ in range(n)))
+        concurrent = time.perf_counter() - start
+        
+        ok = sum(1 for r in responses if r.status_code == 200)
+        print(f"\n{service.upper()} concurrency: {ok}/{n} OK")
+        print(f"  1 request:  {single:.2f}s")
+        print(f"  {n} requests: {concurrent:.2f}s ({concurrent / single:.1f}x single)")
+        
+        # Serialized requests would take about n times as long
+        if concurrent < single * (n / 2):
+            print("✓ Requests ran concurrently")
+        else:
+            print("✗ Requests appear to be serialized")
+
+
 async def main():
     """Run tests."""
     print("Testing TTS Backend\n" + "=" * 40)
@@ -44,6 +228,15 @@ async def main():
     # Test services
     await test_synthesize("gemini")
     await test_synthesize("openai")
+    await test_synthesize("auto")
+    await test_raw("gemini")
+    await test_stream("gemini")
+    await test_stream("openai")
+    await test_batch()
+    await test_websocket("openai")
+    await test_deadline("gemini")
+    await test_audio_url("openai")
+    await test_concurrency("openai")
     
     print("\n" + "=" * 40)
 
@@ -0,0 +1,68 @@
+"""Local transcoding from a canonical WAV render to the other output formats.
+
+Encoding runs in ffmpeg child processes, at most TRANSCODE_MAX_WORKERS at a time,
+so CPU-heavy work never runs on the event loop.
+"""
+import asyncio
+import shutil
+from typing import Optional
+
+from audio import split_wav
+from config import TRANSCODE_ENABLED, TRANSCODE_FFMPEG, TRANSCODE_MAX_WORKERS
+
+# Format requested from the provider when transcoding locally
+CANONICAL_FORMAT = "wav"
+
+# ffmpeg output options per target format (speech-oriented bitrates)
+_ENCODERS = {
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "64k", "-f", "mp3"],
+    "ogg": ["-c:a", "libopus", "-b:a", "48k", "-f", "ogg"],
+    "opus": ["-c:a", "libopus", "-b:a", "48k", "-f", "ogg"],
+    "aac": ["-c:a", "aac", "-b:a", "64k", "-f", "adts"],
+    "flac": ["-c:a", "flac", "-f", "flac"],
+}
+
+_ffmpeg: Optional[str] = shutil.which(TRANSCODE_FFMPEG) if TRANSCODE_ENABLED else None
+_semaphore = asyncio.Semaphore(TRANSCODE_MAX_WORKERS)
+
+
+class TranscodeError(Exception):
+    """Raised when ffmpeg fails to encode the audio."""
+
+
+def available() -> bool:
+    """Return True if local transcoding is enabled and ffmpeg was found."""
+    return _ffmpeg is not None
+
+
+def supports(audio_format: str) -> bool:
+    """Return True if audio_format can be derived from the canonical render."""
+    return audio_format in _ENCODERS or audio_format in ("wav", "pcm")
+
+
+async def transcode(wav: bytes, audio_format: str) -> bytes:
+    """Encode a canonical WAV render into audio_format."""
+    if audio_format == "wav":
+        return wav
+    if audio_format == "pcm":
+        return split_wav(wav)[1]
+    if _ffmpeg is None:
+        raise TranscodeError("ffmpeg is not available")
+
+    async with _semaphore:
+        proc = await asyncio.create_subprocess_exec(
+            _ffmpeg, "-hide_banner", "-loglevel", "error",
+            "-f", "wav", "-i", "pipe:0",
+            *_ENCODERS[audio_format], "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            encoded, errors = await proc.communicate(wav)
+        except asyncio.CancelledError:
+            proc.kill()
+            raise
+    if proc.returncode != 0:
+        raise TranscodeError(errors.decode("utf-8", errors="replace").strip() or "ffmpeg failed")
+    return encoded
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""Bulk TTS rendering - synthesize every entry of a JSONL or CSV manifest to audio files.
+
+Each entry has "text" and optionally "id", "service", "voice", "language",
+"audio_format", "prompt" (Gemini), "speed" and "instructions" (OpenAI), the same
+fields the single-text scripts read from stdin. Audio is written straight to
+the output directory, named by the SHA-256 of the entry's synthesis parameters:
+identical entries are rendered once, and entries whose file already exists are
+skipped, so an interrupted run picks up where it stopped. Files appear only once
+complete. Every outcome is appended to progress.jsonl in the output directory,
+which also maps entry ids and manifest lines to files.
+
+Usage:
+    python tts_bulk.py manifest.jsonl out/ --service openai --concurrency 8
+"""
+import sys
+import os
+import csv
+import json
+import time
+import hashlib
+import argparse
+import importlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Provider scripts, their request fields and defaults (as in their handle())
+PROVIDERS = {
+    "gemini": ("tts_gemini", {"voice": "Kore", "language": "en-US", "audio_format": "mp3", "prompt": None}),
+    "openai": ("tts_openai", {"voice": "alloy", "language": None, "audio_format": "mp3", "speed": 1.0,
+                              "instructions": None}),
+}
+
+# Audio formats each provider renders natively (tts_gemini.FORMAT_MAP, tts_openai's valid_formats)
+FORMATS = {
+    "gemini": ("mp3", "wav", "ogg", "opus"),
+    "openai": ("mp3", "opus", "aac", "flac", "wav", "pcm"),
+}
+
+# Default upstream requests per second, matching the backend's rate limits
+DEFAULT_RATES = {"gemini": 15.0, "openai": 8.0}
+
+
+class RateLimiter:
+    """Space calls at most `rate` per second across threads (0 disables the limit)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(start - now)
+
+
+class Progress:
+    """Append-only JSONL log of finished entries, safe to write from worker threads."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.logged = set()
+        if path.exists():
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by an interrupted run
+                        continue
+                    if record.get("status") != "failed":
+                        self.logged.add(record["file"])
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def record(self, record: dict):
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def load_manifest(path: str) -> list:
+    """Read manifest entries from a CSV file (by extension) or JSONL, as (line number, entry) pairs."""
+    with open(path, newline="") as f:
+        entries = []
+        if path.endswith(".csv"):
+            reader = csv.DictReader(f)
+            for row in reader:
+                # line_num counts the header and any blank lines the reader skipped
+                entries.append((reader.line_num, {k: v for k, v in row.items() if v not in (None, "")}))
+            return entries
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    entries.append((number, json.loads(line)))
+                except ValueError as e:
+                    raise ValueError(f"{path}:{number}: {e}")
+        return entries
+
+
+def entry_request(entry: dict, default_service: str):
+    """Return (service, synthesis parameters) for a manifest entry."""
+    service = entry.get("service", default_service)
+    if service not in PROVIDERS:
+        raise ValueError(f"Unknown service {service!r}. Must be one of: {', '.join(PROVIDERS)}")
+    if not entry.get("text"):
+        raise ValueError("Entry has no text")
+    _, defaults = PROVIDERS[service]
+    params = {"text": entry["text"]}
+    for name, default in defaults.items():
+        params[name] = entry.get(name, default)
+    if params["audio_format"] not in FORMATS[service]:
+        # Never render one format and save it under another's extension
+        raise ValueError(f"Invalid audio format {params['audio_format']!r} for {service}. "
+                         f"Must be one of: {', '.join(FORMATS[service])}")
+    if "speed" in params:
+        # CSV values are strings
+        params["speed"] = float(params["speed"])
+    return service, params
+
+
+def output_name(service: str, params: dict) -> str:
+    """Name an entry's audio file by the hash of everything that determines the audio."""
+    key = hashlib.sha256(json.dumps({"service": service, **params}, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{key}.{params['audio_format']}"
+
+
+def render(module, params: dict, dest: Path, limiter: RateLimiter, retries: int, stop: threading.Event) -> dict:
+    """Synthesize one entry into dest, retrying failures with exponential backoff."""
+    part = dest.with_name(f".{dest.name}.part")
+    result = {}
+    for attempt in range(retries + 1):
+        if stop.is_set():
+            return {"error": "Interrupted", "success": False}
+        limiter.wait()
+        result = module.synthesize_to_file(str(part), **params)
+        if result["success"]:
+            # Only complete files get the final name, so they can be trusted on resume
+            os.replace(part, dest)
+            return result
+        if attempt < retries:
+            stop.wait(min(0.5 * 2 ** attempt, 8.0))
+    part.unlink(missing_ok=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSONL (or .csv) file of entries to render")
+    parser.add_argument("output", help="Directory for audio files and progress.jsonl")
+    parser.add_argument("--service", choices=sorted(PROVIDERS), default="gemini",
+                        help="Provider for entries without a \"service\" field")
+    parser.add_argument("--concurrency", type=int, default=8, help="Entries rendered at the same time")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Upstream requests per second per provider, 0 for no limit "
+                             f"(default: {', '.join(f'{s} {r:g}' for s, r in DEFAULT_RATES.items())})")
+    parser.add_argument("--retries", type=int, default=2, help="Retries of a failed entry")
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+
+    # Group entries by output file, so identical entries are rendered once
+    pending = {}
+    failures = []
+    entries = load_manifest(args.manifest)
+    for line, entry in entries:
+        try:
+            service, params = entry_request(entry, args.service)
+        except ValueError as e:
+            failures.append({"line": line, "id": entry.get("id"), "error": str(e)})
+            continue
+        name = output_name(service, params)
+        pending.setdefault(name, (service, params, []))[2].append({"line": line, "id": entry.get("id")})
+
+    progress = Progress(output / "progress.jsonl")
+    skipped = 0
+    for name in list(pending):
+        if (output / name).exists():
+            if name not in progress.logged:
+                for source in pending[name][2]:
+                    progress.record({**source, "file": name, "status": "existing"})
+            skipped += len(pending.pop(name)[2])
+
+    limiters = {
+        service: RateLimiter(args.rate if args.rate is not None else DEFAULT_RATES[service])
+        for service in PROVIDERS
+    }
+    modules = {service: importlib.import_module(PROVIDERS[service][0])
+               for service in {service for service, _, _ in pending.values()}}
+    stop = threading.Event()
+    rendered = chars = audio_bytes = 0
+    total = len(pending)
+    print(f"{len(entries)} entries: {total} to render, {skipped} already done, {len(failures)} invalid",
+          file=sys.stderr)
+
+    start = last_report = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    futures = {
+        pool.submit(render, modules[service], params, output / name, limiters[service], args.retries, stop): name
+        for name, (service, params, _) in pending.items()
+    }
+    try:
+        for done, future in enumerate(as_completed(futures), 1):
+            name = futures[future]
+            service, params, sources = pending[name]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": str(e), "success": False}
+            if result["success"]:
+                rendered += len(sources)
+                chars += len(params["text"])
+                audio_bytes += result["bytes"]
+                for source in sources:
+                    progress.record({**source, "file": name, "status": "done", "bytes": result["bytes"]})
+            else:
+                for source in sources:
+                    failures.append({**source, "error": result["error"]})
+                    progress.record({**source, "file": name, "status": "failed", "error": result["error"]})
+            now = time.perf_counter()
+            if now - last_report >= 5 or done == total:
+                last_report = now
+                print(f"[{done}/{total}] {done / (now - start):.1f} files/s", file=sys.stderr)
+    except KeyboardInterrupt:
+        print("Interrupted; finishing requests in flight. Run again to resume.", file=sys.stderr)
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        pool.shutdown(wait=True)
+        progress.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"\nRendered {rendered}, skipped {skipped} already done, failed {len(failures)} "
+          f"of {len(entries)} entries in {elapsed:.1f}s")
+    if rendered:
+        print(f"Throughput: {rendered / elapsed:.2f} entries/s, {chars / elapsed:.0f} chars/s, "
+              f"{audio_bytes / elapsed / 1e6:.2f} MB/s of audio")
+    failures.sort(key=lambda failure: failure["line"])
+    for failure in failures[:20]:
+        label = f"line {failure['line']}" + (f" (id {failure['id']})" if failure.get("id") else "")
+        print(f"  ✗ {label}: {failure['error']}")
+    if len(failures) > 20:
+        print(f"  ... and {len(failures) - 20} more in {output / 'progress.jsonl'}")
+    sys.exit(1 if failures or stop.is_set() else 0)
+
+
+if __name__ == "__main__":
+    main()
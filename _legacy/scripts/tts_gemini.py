@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 """Standalone Gemini TTS script - called from Flutter via platform channels."""
 import sys
+import os
 import json
+import base64
+import argparse
+import threading
+from typing import Optional
 import httpx
 
 # Try to import google.auth for OAuth2 authentication
@@ -17,31 +22,53 @@ except ImportError:
 # Required OAuth scopes for Text-to-Speech API
 SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
 
+# Format mapping
+FORMAT_MAP = {
+    "mp3": "MP3",
+    "wav": "LINEAR16",
+    "ogg": "OGG_OPUS",
+    "opus": "OGG_OPUS",
+}
+
+# Credentials and HTTP connections are kept warm across requests in --serve mode
+_credentials = None
+_credentials_lock = threading.Lock()
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client():
+    """Return the shared HTTP client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(timeout=30.0)
+        return _client
+
 
 def _get_access_token():
     """Get OAuth2 access token using Application Default Credentials with correct scopes."""
+    global _credentials
     if not GOOGLE_AUTH_AVAILABLE:
         return None, "google-auth library not installed. Install with: pip install google-auth google-auth-httplib2 requests"
     
     try:
-        # Try service account key file first (for sandboxed apps)
-        service_account_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        if service_account_path and os.path.exists(service_account_path):
-            credentials = service_account.Credentials.from_service_account_file(
-                service_account_path,
-                scopes=SCOPES
-            )
+        with _credentials_lock:
+            if _credentials is None:
+                # Try service account key file first (for sandboxed apps)
+                service_account_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+                if service_account_path and os.path.exists(service_account_path):
+                    _credentials = service_account.Credentials.from_service_account_file(
+                        service_account_path,
+                        scopes=SCOPES
+                    )
+                else:
+                    # Fall back to Application Default Credentials with scopes
+                    _credentials, project = default(scopes=SCOPES)
             # Refresh if needed
-            if not credentials.valid:  # type: ignore
-                credentials.refresh(Request())  # type: ignore
-            return credentials.token, None  # type: ignore
-        
-        # Fall back to Application Default Credentials with scopes
-        credentials, project = default(scopes=SCOPES)
-        # Refresh if needed
-        if not credentials.valid:  # type: ignore
-            credentials.refresh(Request())  # type: ignore
-        return credentials.token, None  # type: ignore
+            if not _credentials.valid:  # type: ignore
+                _credentials.refresh(Request())  # type: ignore
+            return _credentials.token, None  # type: ignore
     except Exception as e:
         error_msg = str(e)
         # Provide more helpful error message
@@ -55,9 +82,9 @@ def _get_access_token():
         return None, error_msg
 
 
-def synthesize(text: str, voice: str = "Kore", language: str = "en-US", 
-               audio_format: str = "mp3", prompt: str = None) -> dict:
-    """Synthesize speech using Google Cloud Text-to-Speech API with Gemini model."""
+def _post(text: str, voice: str, language: str, audio_format: str,
+          prompt: Optional[str] = None) -> httpx.Response:
+    """Send one synthesis request and return the response; raise RuntimeError without credentials."""
     # Get OAuth2 access token
     access_token, error = _get_access_token()
     
@@ -83,20 +110,10 @@ def synthesize(text: str, voice: str = "Kore", language: str = "en-US",
                 "2. Application Default Credentials: gcloud auth application-default login\n"
                 f"Error: {error or 'Unknown authentication error'}"
             )
-        return {
-            "error": error_msg,
-            "success": False
-        }
-    
-    url = "https://texttospeech.googleapis.com/v1/text:synthesize"
+        raise RuntimeError(error_msg)
     
-    # Format mapping
-    format_map = {
-        "mp3": "MP3",
-        "wav": "LINEAR16",
-        "ogg": "OGG_OPUS",
-        "opus": "OGG_OPUS",
-    }
+    # Overridable like the backend's GEMINI_API_URL, e.g. for the offline stand-ins
+    url = os.getenv("GEMINI_API_URL", "https://texttospeech.googleapis.com/v1/text:synthesize")
     
     payload = {
         "input": {"text": text},
@@ -106,7 +123,7 @@ def synthesize(text: str, voice: str = "Kore", language: str = "en-US",
             "modelName": "gemini-2.5-flash-tts",
         },
         "audioConfig": {
-            "audioEncoding": format_map.get(audio_format, "MP3"),
+            "audioEncoding": FORMAT_MAP.get(audio_format, "MP3"),
         },
     }
     
@@ -118,27 +135,67 @@ def synthesize(text: str, voice: str = "Kore", language: str = "en-US",
         "Content-Type": "application/json",
     }
     
+    return _get_client().post(url, json=payload, headers=headers)
+
+
+def synthesize(text: str, voice: str = "Kore", language: str = "en-US", 
+               audio_format: str = "mp3", prompt: Optional[str] = None) -> dict:
+    """Synthesize speech using Google Cloud Text-to-Speech API with Gemini model."""
+    try:
+        resp = _post(text, voice, language, audio_format, prompt)
+        
+        if resp.status_code != 200:
+            return {
+                "error": f"Gemini API error: {resp.text}",
+                "success": False
+            }
+        
+        data = resp.json()
+        word_count = len(text.split())
+        duration_ms = int((word_count / 150) * 60 * 1000)
+        
+        return {
+            "audio_data": data["audioContent"],
+            "audio_format": audio_format,
+            "duration_ms": duration_ms,
+            "metadata": json.dumps({"service": "gemini", "voice": voice}),
+            "success": True
+        }
+    except Exception as e:
+        return {
+            "error": str(e),
+            "success": False
+        }
+
+
+def synthesize_to_file(path: str, text: str, voice: str = "Kore", language: str = "en-US",
+                       audio_format: str = "mp3", prompt: Optional[str] = None) -> dict:
+    """Synthesize speech and write the decoded audio to path instead of returning base64."""
+    if audio_format not in FORMAT_MAP:
+        # synthesize() falls back to MP3; here that would write MP3 under another extension
+        return {
+            "error": f"Invalid audio format for Gemini. Must be one of: {', '.join(FORMAT_MAP)}",
+            "success": False
+        }
+    
     try:
-        with httpx.Client(timeout=30.0) as client:
-            resp = client.post(url, json=payload, headers=headers)
-            
-            if resp.status_code != 200:
-                return {
-                    "error": f"Gemini API error: {resp.text}",
-                    "success": False
-                }
-            
-            data = resp.json()
-            word_count = len(text.split())
-            duration_ms = int((word_count / 150) * 60 * 1000)
-            
+        resp = _post(text, voice, language, audio_format, prompt)
+        
+        if resp.status_code != 200:
             return {
-                "audio_data": data["audioContent"],
-                "audio_format": audio_format,
-                "duration_ms": duration_ms,
-                "metadata": json.dumps({"service": "gemini", "voice": voice}),
-                "success": True
+                "error": f"Gemini API error: {resp.text}",
+                "success": False
             }
+        
+        audio_bytes = base64.b64decode(resp.json()["audioContent"])
+        with open(path, "wb") as f:
+            f.write(audio_bytes)
+        
+        return {
+            "audio_format": audio_format,
+            "bytes": len(audio_bytes),
+            "success": True
+        }
     except Exception as e:
         return {
             "error": str(e),
@@ -146,18 +203,43 @@ def synthesize(text: str, voice: str = "Kore", language: str = "en-US",
         }
 
 
+def handle(input_data: dict) -> dict:
+    """Synthesize one JSON request."""
+    return synthesize(
+        text=input_data.get("text", ""),
+        voice=input_data.get("voice", "Kore"),
+        language=input_data.get("language", "en-US"),
+        audio_format=input_data.get("audio_format", "mp3"),
+        prompt=input_data.get("prompt")
+    )
+
+
+def warm_up():
+    """Load credentials and open the connection before the first request."""
+    _, error = _get_access_token()
+    if error:
+        raise RuntimeError(error)
+    _get_client()
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--serve", action="store_true",
+                        help="Stay running and answer newline-delimited JSON requests on stdin")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Requests handled concurrently in --serve mode")
+    args = parser.parse_args()
+    
+    if args.serve:
+        from tts_worker import serve
+        serve(handle, workers=args.workers, warm_up=warm_up)
+        sys.exit(0)
+    
     # Read JSON input from stdin
     try:
         input_data = json.loads(sys.stdin.read())
         
-        result = synthesize(
-            text=input_data.get("text", ""),
-            voice=input_data.get("voice", "Kore"),
-            language=input_data.get("language", "en-US"),
-            audio_format=input_data.get("audio_format", "mp3"),
-            prompt=input_data.get("prompt")
-        )
+        result = handle(input_data)
         
         # Output JSON result to stdout
         print(json.dumps(result))
@@ -166,4 +248,3 @@ if __name__ == "__main__":
             "error": str(e),
             "success": False
         }))
-
@@ -4,8 +4,10 @@ import sys
 import json
 import base64
 import os
+import argparse
+import threading
 from pathlib import Path
-from typing import Literal, cast
+from typing import Literal, Optional, cast
 
 # Add parent directory to path to import config
 # Try multiple paths to find config
@@ -33,56 +35,69 @@ from openai import OpenAI
 OpenAIVoice = Literal["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
 OpenAIAudioFormat = Literal["mp3", "opus", "aac", "flac", "wav", "pcm"]
 
+# The client (and its connection pool) is kept warm across requests in --serve mode
+_client = None
+_client_lock = threading.Lock()
 
-def synthesize(text: str, voice: str = "alloy", language: str = None,
-               audio_format: str = "mp3", speed: float = 1.0, instructions: str = None) -> dict:
-    """Synthesize speech using OpenAI TTS."""
+
+def _get_client() -> OpenAI:
+    """Return the shared OpenAI client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpenAI(api_key=OPENAI_API_KEY)
+        return _client
+
+
+def _request_params(text: str, voice: str, audio_format: str, speed: float,
+                    instructions: Optional[str] = None) -> dict:
+    """Validate a request and build the OpenAI speech parameters; raise ValueError if it is invalid."""
     if not OPENAI_API_KEY:
-        return {
-            "error": "OpenAI TTS not configured. Set OPENAI_API_KEY in .env",
-            "success": False
-        }
-    
-    client = OpenAI(api_key=OPENAI_API_KEY)
+        raise ValueError("OpenAI TTS not configured. Set OPENAI_API_KEY in .env")
     
     # Validate and cast voice
     valid_voices: list[OpenAIVoice] = ["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
     if voice not in valid_voices:
-        return {
-            "error": f"Invalid voice. Must be one of: {', '.join(valid_voices)}",
-            "success": False
-        }
+        raise ValueError(f"Invalid voice. Must be one of: {', '.join(valid_voices)}")
     voice_literal = cast(OpenAIVoice, voice)
     
     # Validate and cast audio format
     valid_formats: list[OpenAIAudioFormat] = ["mp3", "opus", "aac", "flac", "wav", "pcm"]
     if audio_format not in valid_formats:
+        raise ValueError(f"Invalid audio format. Must be one of: {', '.join(valid_formats)}")
+    format_literal = cast(OpenAIAudioFormat, audio_format)
+    
+    # Build request parameters
+    request_params = {
+        "model": "gpt-4o-mini-tts",
+        "voice": voice_literal,
+        "input": text,
+        "response_format": format_literal,
+        "speed": speed,
+    }
+    
+    # Add instructions if provided
+    if instructions:
+        request_params["instructions"] = instructions
+    return request_params
+
+
+def synthesize(text: str, voice: str = "alloy", language: Optional[str] = None,
+               audio_format: str = "mp3", speed: float = 1.0, instructions: Optional[str] = None) -> dict:
+    """Synthesize speech using OpenAI TTS."""
+    try:
+        request_params = _request_params(text, voice, audio_format, speed, instructions)
+    except ValueError as e:
         return {
-            "error": f"Invalid audio format. Must be one of: {', '.join(valid_formats)}",
+            "error": str(e),
             "success": False
         }
-    format_literal = cast(OpenAIAudioFormat, audio_format)
     
     try:
-        # Build request parameters
-        request_params = {
-            "model": "gpt-4o-mini-tts",
-            "voice": voice_literal,
-            "input": text,
-            "response_format": format_literal,
-            "speed": speed,
-        }
-        
-        # Add instructions if provided
-        if instructions:
-            request_params["instructions"] = instructions
-        
         # Use streaming response
-        with client.audio.speech.with_streaming_response.create(**request_params) as response:
+        with _get_client().audio.speech.with_streaming_response.create(**request_params) as response:
             # Collect all chunks into bytes
-            audio_bytes = b""
-            for chunk in response.iter_bytes():
-                audio_bytes += chunk
+            audio_bytes = b"".join(response.iter_bytes())
         
         audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
         
@@ -103,19 +118,74 @@ def synthesize(text: str, voice: str = "alloy", language: str = None,
         }
 
 
+def synthesize_to_file(path: str, text: str, voice: str = "alloy", language: Optional[str] = None,
+                       audio_format: str = "mp3", speed: float = 1.0, instructions: Optional[str] = None) -> dict:
+    """Synthesize speech and stream the audio into path instead of returning base64."""
+    try:
+        request_params = _request_params(text, voice, audio_format, speed, instructions)
+    except ValueError as e:
+        return {
+            "error": str(e),
+            "success": False
+        }
+    
+    try:
+        size = 0
+        with _get_client().audio.speech.with_streaming_response.create(**request_params) as response:
+            with open(path, "wb") as f:
+                for chunk in response.iter_bytes():
+                    f.write(chunk)
+                    size += len(chunk)
+        
+        return {
+            "audio_format": audio_format,
+            "bytes": size,
+            "success": True
+        }
+    except Exception as e:
+        return {
+            "error": f"OpenAI API error: {str(e)}",
+            "success": False
+        }
+
+
+def handle(input_data: dict) -> dict:
+    """Synthesize one JSON request."""
+    return synthesize(
+        text=input_data.get("text", ""),
+        voice=input_data.get("voice", "alloy"),
+        language=input_data.get("language"),
+        audio_format=input_data.get("audio_format", "mp3"),
+        speed=input_data.get("speed", 1.0),
+        instructions=input_data.get("instructions")
+    )
+
+
+def warm_up():
+    """Create the client before the first request."""
+    if not OPENAI_API_KEY:
+        raise RuntimeError("OpenAI TTS not configured. Set OPENAI_API_KEY in .env")
+    _get_client()
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--serve", action="store_true",
+                        help="Stay running and answer newline-delimited JSON requests on stdin")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Requests handled concurrently in --serve mode")
+    args = parser.parse_args()
+    
+    if args.serve:
+        from tts_worker import serve
+        serve(handle, workers=args.workers, warm_up=warm_up)
+        sys.exit(0)
+    
     # Read JSON input from stdin
     try:
         input_data = json.loads(sys.stdin.read())
         
-        result = synthesize(
-            text=input_data.get("text", ""),
-            voice=input_data.get("voice", "alloy"),
-            language=input_data.get("language"),
-            audio_format=input_data.get("audio_format", "mp3"),
-            speed=input_data.get("speed", 1.0),
-            instructions=input_data.get("instructions")
-        )
+        result = handle(input_data)
         
         # Output JSON result to stdout
         print(json.dumps(result))
@@ -124,4 +194,3 @@ if __name__ == "__main__":
             "error": str(e),
             "success": False
         }))
-
@@ -0,0 +1,56 @@
+"""Long-lived worker loop shared by the standalone TTS scripts.
+
+Reads one JSON request per line on stdin and writes one JSON response per line on
+stdout. Each response echoes the request's "id" so the caller can correlate them;
+requests run concurrently on a thread pool, so responses may arrive out of order.
+"""
+import sys
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+_write_lock = threading.Lock()
+
+
+def _write(message: dict):
+    """Write one JSON line to stdout without interleaving concurrent responses."""
+    line = json.dumps(message)
+    with _write_lock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+
+def _run(handle: Callable[[dict], dict], line: str):
+    request_id = None
+    try:
+        input_data = json.loads(line)
+        request_id = input_data.get("id")
+        result = handle(input_data)
+    except Exception as e:
+        result = {
+            "error": str(e),
+            "success": False
+        }
+    _write({"id": request_id, **result})
+
+
+def serve(handle: Callable[[dict], dict], workers: int = 4, warm_up: Optional[Callable[[], None]] = None):
+    """Serve newline-delimited JSON requests from stdin until it is closed.
+    
+    warm_up runs before the first request (e.g. to load credentials and open
+    connections); a {"ready": true} line is written once it finishes.
+    """
+    ready: dict = {"ready": True}
+    if warm_up is not None:
+        try:
+            warm_up()
+        except Exception as e:
+            # Not fatal: requests will report the same problem individually
+            ready["error"] = str(e)
+    _write(ready)
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for line in sys.stdin:
+            if line.strip():
+                pool.submit(_run, handle, line)